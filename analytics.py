@@ -0,0 +1,131 @@
+"""Статистика использования киосков: просмотры страниц, открытия PDF, нажатия плиток.
+
+Киоски присылают события пачками (POST /analytics/events). Здесь они не
+пишутся в БД по одному, а копятся в памяти процесса и раз в несколько
+секунд сбрасываются одной транзакцией: сырые события и сразу почасовые и
+посуточные сводки (upsert через executemany). Админка читает только
+сводки, сырые события хранятся ограниченное время — на случай пересчёта.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+KINDS = ("page_view", "pdf_open", "tile_tap")
+MAX_KIOSK_ID = 64
+CLOCK_SKEW = 24 * 3600  # время события с киоска принимаем, если оно не дальше суток от серверного
+
+# Таблицы analytics_* создаёт миграция 3f1c0a9d2b7e
+
+
+def parse_events(payload, now=None):
+    """Проверить пачку от киоска: {"kiosk": id, "events": [{kind, target, ts}]}.
+    Возвращает список (kiosk, kind, target, ts); кривые события отбрасываются."""
+    now = now or time.time()
+    if not isinstance(payload, dict):
+        return []
+    kiosk = str(payload.get("kiosk") or "unknown")[:MAX_KIOSK_ID]
+    events = payload.get("events")
+    if not isinstance(events, list):
+        return []
+    out = []
+    for event in events:
+        if not isinstance(event, dict) or event.get("kind") not in KINDS:
+            continue
+        try:
+            target = int(event.get("target"))
+            ts = float(event.get("ts", now * 1000)) / 1000  # с киоска — миллисекунды JS
+        except (TypeError, ValueError):
+            continue
+        if abs(ts - now) > CLOCK_SKEW:
+            ts = now
+        out.append((kiosk, event["kind"], target, ts))
+    return out
+
+
+def write_batch(conn, events, keep_days=None):
+    """Одна транзакция: сырые события + сводки по часам и дням."""
+    hourly = Counter((kiosk, kind, target, int(ts // 3600 * 3600)) for kiosk, kind, target, ts in events)
+    daily = Counter(
+        (kiosk, kind, target, datetime.fromtimestamp(ts).strftime("%Y-%m-%d")) for kiosk, kind, target, ts in events
+    )
+    conn.executemany("INSERT INTO analytics_events(kiosk, kind, target, ts) VALUES (?, ?, ?, ?)", events)
+    conn.executemany(
+        """INSERT INTO analytics_hourly(kiosk, kind, target, hour, count) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(hour, kiosk, kind, target) DO UPDATE SET count = count + excluded.count""",
+        [key + (count,) for key, count in hourly.items()],
+    )
+    conn.executemany(
+        """INSERT INTO analytics_daily(kiosk, kind, target, day, count) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(day, kiosk, kind, target) DO UPDATE SET count = count + excluded.count""",
+        [key + (count,) for key, count in daily.items()],
+    )
+    if keep_days:
+        conn.execute("DELETE FROM analytics_events WHERE ts < ?", (time.time() - keep_days * 86400,))
+    conn.commit()
+
+
+class EventBuffer:
+    """Буфер событий с фоновым сбросом раз в interval секунд (или раньше,
+    если набралось flush_size). flush(events) пишет пачку в БД.
+
+    Если БД недоступна, пачка возвращается в буфер; сверх max_pending
+    старые события отбрасываются — статистика не должна съесть память."""
+
+    def __init__(self, flush, interval=5.0, flush_size=2000, max_pending=100_000):
+        self.flush = flush
+        self.interval = interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    def add(self, events):
+        with self._lock:
+            self._events.extend(events)
+            self._trim()
+            full = len(self._events) >= self.flush_size
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True, name="analytics-flush")
+                self._worker.start()
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def _trim(self):
+        extra = len(self._events) - self.max_pending
+        if extra > 0:
+            del self._events[:extra]
+            self.dropped += extra
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush_now()
+
+    def flush_now(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._events = self._events, []
+            if not batch:
+                return 0
+            try:
+                self.flush(batch)
+            except Exception:
+                log.exception("не удалось записать %d событий статистики, повторим позже", len(batch))
+                with self._lock:
+                    self._events[:0] = batch
+                    self._trim()
+                return 0
+            return len(batch)
@@ -1,29 +1,115 @@
+import atexit
+import base64
+import hashlib
+import json
+import mimetypes
 import os
 import sqlite3
+import threading
+import time
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, session, flash, jsonify
-from werkzeug.utils import secure_filename
+from urllib.parse import quote, unquote
+import click
+from flask import Flask, render_template, request, redirect, url_for, send_file, send_from_directory, session, flash, jsonify, Response, stream_with_context, g, abort
+from flask import before_render_template, template_rendered
+from werkzeug.security import safe_join
+from werkzeug.wsgi import LimitedStream
 from flask_sqlalchemy import SQLAlchemy
-import qrcode  # для генерации PNG QR
-from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+import analytics
+import archive
+from assets import AssetPipeline
+from images import ImagePipeline, is_raster
+from jobs import Jobs
+import layout
+from metrics import Metrics, format_slow_request
+import page_content
+from export import StaticExporter, fingerprint
+from offline import OfflineManifest
+from qrcodes import QR_FORMATS, QrCache, qr_key
+from resumable import ResumableUploads, UploadError
+import search
+from render_cache import ContentVersion, RenderCache
+from storage import UploadStore, is_content_addressed
+from upload_gc import UploadGC
 
 
 # ---------- Пути/настройки ----------
 BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "database.db"              # ЕДИНАЯ БД
-UPLOAD_DIR = BASE_DIR / "static" / "uploads"
+DB_PATH = Path(os.environ.get("KIOSK_DB_PATH", BASE_DIR / "database.db"))  # ЕДИНАЯ БД
+SQLITE_BUSY_TIMEOUT_MS = 5000       # сколько ждать write-lock вместо "database is locked"
+SQLITE_CACHED_STATEMENTS = 256      # кэш подготовленных запросов на соединение
+UPLOAD_DIR = Path(os.environ.get("KIOSK_UPLOAD_DIR", BASE_DIR / "static" / "uploads"))
+INSTANCE_DIR = Path(os.environ.get("KIOSK_INSTANCE_DIR", BASE_DIR / "instance"))  # кэши, экспорт, задачи
+MIGRATIONS_DIR = BASE_DIR / "migrations"
 ALLOWED_EXT = {"png", "jpg", "jpeg", "gif", "pdf", "svg"}
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-UPLOAD_FOLDER = Path(__file__).resolve().parent / "uploads/buttons"
-UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)  # создаёт папку, если нет
+# Старые иконки кнопок (в БД — buttons/<имя>): только читаются (migrate-uploads) и
+# убираются (upload_gc). Каталог в checkout принадлежит только БД по умолчанию;
+# экземпляру со своей БД (KIOSK_DB_PATH) его нужно указать явно, иначе его нет.
+_legacy_icons = os.environ.get("KIOSK_LEGACY_ICON_DIR") or (
+    None if "KIOSK_DB_PATH" in os.environ else BASE_DIR / "uploads" / "buttons")
+UPLOAD_FOLDER = Path(_legacy_icons) if _legacy_icons else None
 
 
 app = Flask(__name__)
 app.secret_key = "change_me_secret"
 app.config["UPLOAD_FOLDER"] = str(UPLOAD_DIR)
+app.config["RENDER_CACHE_MAX_BYTES"] = 16 * 1024 * 1024  # память под готовые /kiosk и /page
+app.config["EVENTS_POLL_INTERVAL"] = 1.0      # как часто поток SSE проверяет версию контента, сек
+app.config["EVENTS_HEARTBEAT_INTERVAL"] = 15  # комментарий-пинг, чтобы прокси не рвали соединение
+app.config["EVENTS_KEEP"] = 1000              # сколько последних событий хранить для переподключений
+# Открытый /events занимает поток воркера (gthread) целиком. Сверх этого числа
+# потоков на процесс киоск не держит соединение, а переподключается раз в
+# EVENTS_OVERFLOW_RETRY сек и забирает накопившееся — остальные потоки
+# остаются обычным запросам (см. gunicorn.conf.py)
+app.config["EVENTS_MAX_CLIENTS"] = int(os.environ.get("KIOSK_EVENTS_MAX_CLIENTS", 8))
+app.config["EVENTS_OVERFLOW_RETRY"] = 30
+app.config["IMAGE_WORKERS"] = 2               # потоки для сборки уменьшенных копий изображений
+# Отдача /uploads фронт-прокси: None (сам Flask), "x-accel-redirect" (nginx) или "x-sendfile" (Apache/lighttpd).
+# Для nginx: location /_uploads_internal/ { internal; alias /путь/к/static/uploads/; }
+app.config["UPLOADS_SENDFILE"] = os.environ.get("KIOSK_UPLOADS_SENDFILE") or None
+app.config["UPLOADS_ACCEL_PREFIX"] = "/_uploads_internal/"
+# Пределы загрузок: тело одного запроса (форма, часть файла) — больше будет 413;
+# большие PDF админка шлёт частями (см. resumable.py), для них свой предел на файл
+app.config["MAX_CONTENT_LENGTH"] = 32 * 1024 * 1024
+app.config["UPLOAD_MAX_FILE_BYTES"] = 512 * 1024 * 1024
+app.config["UPLOAD_CHUNK_BYTES"] = 4 * 1024 * 1024
+app.config["UPLOAD_SESSION_TTL"] = 24 * 3600  # сек без новых частей, после которых сессия удаляется
+app.config["CONTENT_IMPORT_MAX_BYTES"] = 4 * 1024 * 1024 * 1024  # архив импорта контента (см. archive.py)
+# Уборка неиспользуемых загрузок (см. upload_gc.py): файл без ссылок удаляется
+# не раньше чем через GRACE сек после того, как его заметили; прогон — раз в INTERVAL
+app.config["UPLOAD_GC_GRACE"] = 24 * 3600
+app.config["UPLOAD_GC_INTERVAL"] = 6 * 3600
+# Каталог статического экспорта киоска (см. export.py). Если задан, экспорт
+# пересобирается в фоне после каждой правки из админки.
+app.config["STATIC_EXPORT_DIR"] = os.environ.get("KIOSK_STATIC_EXPORT_DIR") or None
+app.config["STATIC_EXPORT_DELAY"] = 2.0  # сек: правки за это время собираются одной пересборкой
+# Манифест офлайн-режима (см. offline.py) собирается в фоне; пока его нет — 503
+app.config["OFFLINE_MANIFEST_DELAY"] = 1.0  # сек: правки за это время собираются одной сборкой
+app.config["OFFLINE_MANIFEST_RETRY"] = 5    # Retry-After ответа 503, сек
+app.config["ANALYTICS_FLUSH_INTERVAL"] = 5.0  # сек между сбросами буфера статистики в БД
+app.config["ANALYTICS_MAX_BATCH"] = 500       # событий в одном POST от киоска
+app.config["ANALYTICS_KEEP_DAYS"] = 30        # сколько хранить сырые события (сводки — всегда)
+# Порог журнала медленных запросов, мс (со списком SQL); None — журнал выключен
+app.config["SLOW_REQUEST_MS"] = float(os.environ["KIOSK_SLOW_REQUEST_MS"]) if os.environ.get("KIOSK_SLOW_REQUEST_MS") else None
+metrics = Metrics(slow_request_ms=app.config["SLOW_REQUEST_MS"])
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_PATH}"  # ORM тоже в database.db
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-orm = SQLAlchemy(app)  # <-- Переименовал, чтобы не конфликтовало с функцией подключения
+# Один пул соединений на процесс: им пользуются и ORM, и get_conn()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    "poolclass": QueuePool,
+    "pool_size": 8,
+    "max_overflow": 16,
+    "connect_args": {
+        "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        "check_same_thread": False,  # соединение может вернуться в пул из другого потока
+        "cached_statements": SQLITE_CACHED_STATEMENTS,
+        "factory": metrics.connection_factory,  # считает SQL и от get_conn(), и от ORM
+    },
+}
+orm = SQLAlchemy()  # <-- Переименовал, чтобы не конфликтовало с функцией подключения; init_app — в create_app()
 
 # ---------- Модель ORM ----------
 class Organization(orm.Model):
@@ -32,94 +118,374 @@ class Organization(orm.Model):
     logo_path = orm.Column(orm.String(200))
     qr_value = orm.Column(orm.String(500))  # текст/URL, из которого рисуем QR
 
-with app.app_context():
-    orm.create_all()
+def _configure_sqlite(dbapi_conn, connection_record):
+    """Настройки каждого нового соединения пула: WAL + busy_timeout.
+
+    В WAL читатели не блокируются писателем, а busy_timeout заставляет
+    конкурирующих писателей ждать, а не падать с "database is locked".
+    """
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cur.close()
+
+def _reset_row_factory(dbapi_conn, connection_record):
+    # get_conn() включает sqlite3.Row; ORM получает соединение в исходном виде
+    dbapi_conn.row_factory = None
+
+# ---------- Метрики ----------
+@app.before_request
+def _metrics_start():
+    metrics.start_request()
+
+@app.after_request
+def _metrics_finish(response):
+    slow = metrics.finish_request(request.method, request.endpoint, response.status_code)
+    if slow is not None:
+        app.logger.warning("медленный запрос: %s", format_slow_request(request.method, request.full_path.rstrip("?"), response.status_code, slow))
+    return response
+
+@app.teardown_request
+def _metrics_teardown(exc):
+    # after_request не вызывается, если view упал с исключением
+    if exc is not None:
+        metrics.finish_request(request.method, request.endpoint, 500)
+
+@before_render_template.connect_via(app)
+def _template_started(sender, template, context, **extra):
+    metrics.template_started()
+
+@template_rendered.connect_via(app)
+def _template_finished(sender, template, context, **extra):
+    metrics.template_finished(template.name)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 # ---------- Helpers ----------
 def get_conn():
-    """Подключение к той же БД, что использует SQLAlchemy."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Соединение из общего с SQLAlchemy пула.
+
+    close() не закрывает соединение, а возвращает его в пул (с откатом
+    незакоммиченной транзакции).
+    """
+    conn = orm.engine.raw_connection()
+    conn.dbapi_connection.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+def _migrate():
+    """Flask-Migrate тянет за собой alembic (~0.2 с импорта), поэтому он
+    подключается только там, где нужны миграции: `flask db ...` и init_db()."""
+    if "migrate" not in app.extensions:
+        from flask_migrate import Migrate
+        Migrate(app, orm, directory=str(MIGRATIONS_DIR), render_as_batch=True)
+    return app.extensions["migrate"]
 
-    # Pages
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS pages(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT,
-            image_path TEXT
-        )
-    """)
-
-    # Page PDFs
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS page_pdfs(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            page_id INTEGER NOT NULL,
-            file_path TEXT NOT NULL,
-            title TEXT NOT NULL,
-            FOREIGN KEY(page_id) REFERENCES pages(id)
-        )
-    """)
-
-    # Users
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            password TEXT
-        )
-    """)
-    cur.execute("INSERT OR IGNORE INTO users(username,password) VALUES('admin','admin')")
-
-    # Buttons
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS buttons(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            color TEXT,
-            page_id INTEGER,
-            icon_path TEXT,
-            position INTEGER DEFAULT 0,
-            FOREIGN KEY(page_id) REFERENCES pages(id)
-        )
-    """)
-
-    # Organization (та же таблица, что и у ORM). Добавляем qr_value.
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS organization(
-            id INTEGER PRIMARY KEY,
-            name TEXT,
-            logo_path TEXT,
-            qr_value TEXT
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+def init_db():
+    """Довести схему БД до последней миграции (то же, что `flask db upgrade`)."""
+    import flask_migrate
+    _migrate()
+    flask_migrate.upgrade()
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXT
 
-def save_file(file):
+def _add_upload_ref(conn, relpath, sha, size, count=1):
+    conn.execute(
+        """INSERT INTO upload_refs(path, sha256, size, refcount) VALUES (?, ?, ?, ?)
+           ON CONFLICT(path) DO UPDATE SET refcount = refcount + excluded.refcount""",
+        (relpath, sha, size, count),
+    )
+
+def save_file(file, conn=None):
+    """Сохраняет загрузку в хранилище по хэшу содержимого и возвращает путь
+    вида ab/<sha256>.ext. Повторная загрузка того же файла только
+    увеличивает счётчик ссылок.
+
+    conn — соединение вызывающего, если у него уже открыта транзакция записи
+    (иначе второе соединение упрётся в её блокировку); коммитит вызывающий.
+    """
     if file and getattr(file, "filename", "") and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file.save(UPLOAD_DIR / filename)
-        return filename
+        ext = file.filename.rsplit(".", 1)[1].lower()
+        relpath, sha, size, created = upload_store.save_stream(file.stream, ext)
+        own = conn is None
+        if own:
+            conn = get_conn()
+        _add_upload_ref(conn, relpath, sha, size)
+        if own:
+            conn.commit()
+            conn.close()
+        if created:
+            image_pipeline.submit(relpath)
+        return relpath
     return None
 
-def delete_uploaded_file(safe_filename: str):
+def delete_uploaded_file(safe_filename: str, conn=None):
+    """Снимает одну ссылку с файла. Сам файл и его производные копии здесь
+    не удаляются: транзакция вызывающего ещё может откатиться, а параллельная
+    загрузка того же файла — сослаться на него снова. Файл без ссылок (и
+    старый, без счётчика) убирает upload_gc после UPLOAD_GC_GRACE.
+    conn — как в save_file()."""
     if not safe_filename:
         return
+    own = conn is None
+    if own:
+        conn = get_conn()
+    try:
+        conn.execute("UPDATE upload_refs SET refcount = MAX(refcount - 1, 0) WHERE path=?", (safe_filename,))
+    finally:
+        if own:
+            conn.commit()
+            conn.close()
+
+def _save_inline_image(conn, data, ext):
+    relpath, sha, size, created = upload_store.save_bytes(data, ext)
+    _add_upload_ref(conn, relpath, sha, size)
+    if created:
+        image_pipeline.submit(relpath)
+    return url_for("uploads", filename=relpath)
+
+def _upload_image_size(src):
+    """Размер картинки из /uploads по её URL (читается только заголовок файла)."""
+    prefix = url_for("uploads", filename="")
+    if not src.startswith(prefix):
+        return None
+    path = safe_join(app.config["UPLOAD_FOLDER"], src[len(prefix):].split("?", 1)[0])
+    if path is None or not is_raster(path):
+        return None
+    from PIL import Image
     try:
-        os.remove(os.path.join(app.config["UPLOAD_FOLDER"], safe_filename))
-    except FileNotFoundError:
-        pass
+        with Image.open(path) as im:
+            return im.size
+    except OSError:
+        return None
+
+def process_page_content(html, conn):
+    """HTML из TinyMCE -> (content для редактора, content_html для показа).
+    Встроенные data:-картинки выносятся в файлы (ссылки пишутся через conn)."""
+    html = page_content.extract_inline_images(html, lambda data, ext: _save_inline_image(conn, data, ext))
+    return html, page_content.render_html(html, _upload_image_size)
+
+# ---------- Кэш рендера ----------
+content_version = ContentVersion(DB_PATH.with_name(DB_PATH.name + ".version"))  # рядом со своей БД
+render_cache = RenderCache(app.config["RENDER_CACHE_MAX_BYTES"])
+
+def _build_identity():
+    """Идентичность сборки для ETag и кэша рендера: отпечатки статики из
+    манифеста assets и mtime шаблонов. Считается один раз в create_app()."""
+    digest = hashlib.sha1()
+    for relpath, entry in sorted(assets.manifest.items()):
+        digest.update(f"{relpath}:{entry['hash']}\n".encode("utf-8"))
+    templates_dir = Path(app.root_path) / app.template_folder
+    for path in sorted(templates_dir.rglob("*")):
+        if path.is_file():
+            digest.update(f"{path.relative_to(templates_dir)}:{path.stat().st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+def current_content_version():
+    return content_version.current(get_conn)
+
+def bump_content_version(kind="content", **data):
+    """Вызывать после каждой записи из админки: сбрасывает кэш /kiosk и /page
+    во всех процессах, меняет ETag и рассылает событие kind киоскам по SSE."""
+    def record(conn, version):
+        cur = conn.execute(
+            "INSERT INTO change_events(kind, payload, created_at) VALUES (?, ?, ?)",
+            (kind, json.dumps(data, ensure_ascii=False), time.time()),
+        )
+        conn.execute("DELETE FROM change_events WHERE id <= ?", (cur.lastrowid - app.config["EVENTS_KEEP"],))
+
+    conn = get_conn()
+    try:
+        version = content_version.bump(conn, record)
+    finally:
+        conn.close()
+    if app.config["STATIC_EXPORT_DIR"]:
+        static_export.schedule(export_static, app.config["STATIC_EXPORT_DELAY"])
+    if offline_manifest.root.exists():  # киоски уже пользуются офлайн-режимом
+        offline_manifest.schedule(build_offline_manifest, app.config["OFFLINE_MANIFEST_DELAY"])
+    return version
+
+# ---------- Производные изображений ----------
+def _record_derivatives(source, items):
+    """Вызывается из рабочего потока ImagePipeline."""
+    with app.app_context():
+        conn = get_conn()
+        conn.execute("DELETE FROM image_derivatives WHERE source=?", (source,))
+        conn.executemany(
+            "INSERT INTO image_derivatives(source, width, format, path, bytes) VALUES (?, ?, ?, ?, ?)",
+            [(source, width, fmt, path, size) for width, fmt, path, size in items],
+        )
+        conn.commit()
+        conn.close()
+        # готовые страницы в кэше ссылаются на оригинал — пересобрать
+        bump_content_version("images", source=source)
+
+upload_store = UploadStore(UPLOAD_DIR)
+resumable_uploads = ResumableUploads(upload_store, app.config["UPLOAD_MAX_FILE_BYTES"], app.config["UPLOAD_CHUNK_BYTES"])
+image_pipeline = ImagePipeline(UPLOAD_DIR, workers=app.config["IMAGE_WORKERS"], on_done=_record_derivatives)
+
+def _derivatives(filename):
+    cache = g.setdefault("derivatives", {})
+    if filename not in cache:
+        conn = get_conn()
+        cache[filename] = conn.execute(
+            "SELECT width, format, path FROM image_derivatives WHERE source=? ORDER BY width",
+            (filename,),
+        ).fetchall()
+        conn.close()
+    return cache[filename]
+
+@app.template_global()
+def image_srcset(filename, fmt="jpeg"):
+    return ", ".join(
+        f"{url_for('uploads', filename=row['path'])} {row['width']}w"
+        for row in _derivatives(filename) if row["format"] == fmt
+    )
+
+@app.template_global()
+def image_src(filename, width=640):
+    """src для <img>: наименьшая JPEG-копия не уже width.
+    Оригинал отдаётся, только пока копий нет (svg или сборка ещё идёт)."""
+    rows = [row for row in _derivatives(filename) if row["format"] == "jpeg"]
+    if not rows:
+        return url_for("uploads", filename=filename)
+    fit = [row for row in rows if row["width"] >= width]
+    return url_for("uploads", filename=(fit[0] if fit else rows[-1])["path"])
+
+@app.cli.command("build-derivatives")
+def build_derivatives_command():
+    """Собрать уменьшенные копии для уже загруженных изображений."""
+    for path in sorted(UPLOAD_DIR.rglob("*")):
+        relpath = path.relative_to(UPLOAD_DIR).as_posix()
+        if path.is_file() and is_raster(path.name) and not relpath.startswith(("_d/", ".tmp/")):
+            items = image_pipeline.build(relpath)
+            _record_derivatives(relpath, items)
+            print(f"{relpath}: {len(items)}")
+
+# Таблицы и колонки, где лежат пути загрузок
+UPLOAD_REF_COLUMNS = (
+    ("pages", "image_path"),
+    ("page_pdfs", "file_path"),
+    ("buttons", "icon_path"),
+    ("organization", "logo_path"),
+)
+
+@app.cli.command("migrate-uploads")
+def migrate_uploads_command():
+    """Перенести старые загрузки (static/uploads/<имя>) в хранилище по хэшу
+    и переписать ссылки на них в БД, включая HTML страниц."""
+    with app.test_request_context():
+        _migrate_uploads()
+
+def _migrate_uploads():
+    conn = get_conn()
+    legacy = {}
+    for table, column in UPLOAD_REF_COLUMNS:
+        for row in conn.execute(f"SELECT {column} AS path, COUNT(*) AS n FROM {table} "
+                                f"WHERE {column} IS NOT NULL AND {column} != '' GROUP BY {column}"):
+            if not is_content_addressed(row["path"]):
+                legacy[row["path"]] = legacy.get(row["path"], 0) + row["n"]
+
+    for old in sorted(legacy):
+        # иконки из admin_button_update раньше лежали в uploads/buttons
+        candidates = [UPLOAD_DIR / old] + ([UPLOAD_FOLDER.parent / old] if UPLOAD_FOLDER else [])
+        src = next((p for p in candidates if p.is_file()), None)
+        if src is None or not allowed_file(src.name):
+            print(f"пропущен {old}: файл не найден")
+            continue
+        with open(src, "rb") as f:
+            relpath, sha, size, created = upload_store.save_stream(f, src.suffix[1:].lower())
+        for table, column in UPLOAD_REF_COLUMNS:
+            conn.execute(f"UPDATE {table} SET {column}=? WHERE {column}=?", (relpath, old))
+        _add_upload_ref(conn, relpath, sha, size, legacy[old])
+        if created:
+            image_pipeline.submit(relpath)
+        print(f"{old} -> {relpath}")
+
+    # Ссылки из HTML страниц (картинки TinyMCE)
+    for entry in sorted(UPLOAD_DIR.iterdir()):
+        if not entry.is_file() or not allowed_file(entry.name):
+            continue
+        old_url = url_for("uploads", filename=entry.name)
+        # content_html /page отдаёт первым — переписывать нужно оба столбца
+        rows = conn.execute(
+            "SELECT id, content, content_html FROM pages WHERE instr(content, ?) > 0 OR instr(content_html, ?) > 0",
+            (old_url, old_url),
+        ).fetchall()
+        if not rows:
+            continue
+        with open(entry, "rb") as f:
+            relpath, sha, size, created = upload_store.save_stream(f, entry.suffix[1:].lower())
+        new_url = url_for("uploads", filename=relpath)
+        conn.executemany(
+            "UPDATE pages SET content=?, content_html=? WHERE id=?",
+            [((row["content"] or "").replace(old_url, new_url),
+              row["content_html"].replace(old_url, new_url) if row["content_html"] is not None else None,
+              row["id"]) for row in rows],
+        )
+        _add_upload_ref(conn, relpath, sha, size, len(rows))
+        if created:
+            image_pipeline.submit(relpath)
+        print(f"{old_url} -> {new_url} ({len(rows)} стр.)")
+
+    conn.commit()
+    conn.close()
+    image_pipeline.shutdown()
+    bump_content_version("reload")
+
+# ---------- Статика: отпечатки и предсжатие ----------
+assets = AssetPipeline(app.static_folder, INSTANCE_DIR / "assets")  # build() — в create_app()
+
+STATIC_ENCODINGS = (("br", "br"), ("gzip", "gz"))  # Content-Encoding -> суффикс файла
+
+@app.url_defaults
+def _fingerprint_static(endpoint, values):
+    """url_for('static', filename='css/theme.css') -> /static/css/theme.<hash>.css"""
+    if endpoint == "static" and "filename" in values:
+        values["filename"] = assets.url_name(values["filename"])
+
+@app.template_global()
+def asset_dir_hash(prefix):
+    return assets.dir_hash(prefix)
+
+def serve_static(filename):
+    """Замена стандартного /static: имя с отпечатком, готовые .br/.gz по
+    Accept-Encoding и вечный кэш для URL с отпечатком (или ?v=<хэш каталога>)."""
+    rel, entry, immutable = assets.resolve(filename)
+    if entry is None:
+        return app.send_static_file(filename)
+    if not immutable and request.args.get("v") == assets.dir_hash(rel.split("/", 1)[0]):
+        immutable = True
+
+    encoding, path = None, Path(app.static_folder) / rel
+    for enc, suffix in STATIC_ENCODINGS:
+        if suffix in entry["encodings"] and request.accept_encodings[enc]:
+            encoding, path = enc, assets.encoded_path(rel, suffix)
+            break
+
+    resp = send_file(
+        path,
+        mimetype=mimetypes.guess_type(rel)[0] or "application/octet-stream",
+        etag=f"{entry['hash']}-{encoding or 'identity'}",
+        conditional=True,
+    )
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable" if immutable else "no-cache"
+    return resp
+
+app.view_functions["static"] = serve_static
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Пересчитать отпечатки и досжать изменившуюся статику."""
+    manifest = assets.build()
+    packed = sum(1 for entry in manifest.values() if entry["encodings"])
+    print(f"файлов: {len(manifest)}, сжато: {packed}")
 
 @app.context_processor
 def inject_theme():
@@ -152,6 +518,7 @@ def require_auth():
 
 # ---------- Kiosk ----------
 @app.route("/kiosk")
+@render_cache.cached(current_content_version)
 def kiosk():
     conn = get_conn()
     buttons = conn.execute("SELECT * FROM buttons ORDER BY position ASC").fetchall()
@@ -161,14 +528,24 @@ def kiosk():
     org = Organization.query.first()
     org_name = org.name if org else "Организация"
     org_logo = org.logo_path if org else None
-    # qr_value клиент возьмёт через /get_qr и отрисует через qrcode.min.js
 
-    return render_template("kiosk.html", buttons=buttons, org_name=org_name, org_logo=org_logo)
+    return render_template(
+        "kiosk.html",
+        buttons=buttons,
+        org_name=org_name,
+        org_logo=org_logo,
+        qr_url=qr_url(org.qr_value if org else None),
+    )
 
 @app.route("/page/<int:pid>")
+@render_cache.cached(current_content_version)
 def page(pid):
     conn = get_conn()
-    p = conn.execute("SELECT * FROM pages WHERE id=?", (pid,)).fetchone()
+    # content_html подготовлен при сохранении; сырой content только у старых строк
+    p = conn.execute(
+        "SELECT id, title, image_path, COALESCE(content_html, content) AS content FROM pages WHERE id=?",
+        (pid,),
+    ).fetchone()
     pdfs = conn.execute("SELECT * FROM page_pdfs WHERE page_id=?", (pid,)).fetchall()
     conn.close()
 
@@ -185,6 +562,48 @@ def page(pid):
         org_logo=org.logo_path if org else None
     )
 
+# ---------- Поиск ----------
+@app.route("/search")
+@render_cache.cached(current_content_version)
+def search_pages():
+    """Поиск по мере набора: ?q=нача — каждое слово ищется как префикс."""
+    q = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", 20, type=int), 50))
+    conn = get_conn()
+    results = search.search(conn, q, limit)
+    conn.close()
+    return jsonify(results=[
+        {"id": pid, "title": title, "snippet": snippet, "url": url_for("page", pid=pid)}
+        for pid, title, snippet in results
+    ])
+
+@app.cli.command("extract-inline-images")
+def extract_inline_images_command():
+    """Разовая миграция: вынести data:-картинки из уже сохранённых страниц
+    в файлы и заполнить content_html."""
+    with app.test_request_context():
+        conn = get_conn()
+        ids = [row["id"] for row in conn.execute("SELECT id FROM pages ORDER BY id")]
+        for pid in ids:
+            old = conn.execute("SELECT content FROM pages WHERE id=?", (pid,)).fetchone()["content"]
+            new, new_html = process_page_content(old, conn)
+            conn.execute("UPDATE pages SET content=?, content_html=? WHERE id=?", (new, new_html, pid))
+            conn.commit()
+            if new != old:
+                print(f"страница {pid}: {len(old or '')} -> {len(new or '')} байт")
+        conn.execute("VACUUM")
+        conn.close()
+    image_pipeline.shutdown()
+    bump_content_version("reload")
+
+@app.cli.command("reindex-search")
+def reindex_search_command():
+    """Перестроить полнотекстовый индекс страниц целиком."""
+    conn = get_conn()
+    search.rebuild(conn)
+    conn.commit()
+    conn.close()
+
 # ---------- Admin Dashboard ----------
 @app.route("/admin")
 def admin():
@@ -192,26 +611,152 @@ def admin():
     if redir:
         return redir
 
+    # Страницы подгружаются из /admin/api/pages по мере прокрутки; кнопок
+    # на киоске единицы-десятки, их список нужен целиком для перетаскивания
     conn = get_conn()
-    pages = conn.execute("SELECT * FROM pages ORDER BY id DESC").fetchall()
-    buttons = conn.execute("SELECT * FROM buttons ORDER BY position ASC").fetchall()
+    buttons = conn.execute(
+        f"SELECT {BUTTON_LIST_COLUMNS} FROM buttons b LEFT JOIN pages p ON p.id = b.page_id ORDER BY b.position, b.id"
+    ).fetchall()
+    last_gc = conn.execute(
+        "SELECT * FROM upload_gc_runs WHERE finished_at IS NOT NULL ORDER BY id DESC LIMIT 1"
+    ).fetchone()
     conn.close()
+    if last_gc:
+        last_gc = dict(last_gc, finished=time.strftime("%d.%m.%Y %H:%M", time.localtime(last_gc["finished_at"])))
+    # Фоновая уборка загрузок нужна только там, где ими пользуются: поток
+    # поднимается в воркере, открывшем админку, а прогоны делятся через БД
+    upload_gc.ensure_running(_upload_gc_conn)
 
     org = Organization.query.first()
     organization = {
         "id": org.id,
         "name": org.name,
         "logo_path": org.logo_path,
-        "qr_value": org.qr_value
+        "qr_value": org.qr_value,
+        "qr_url": qr_url(org.qr_value),
     } if org else None
 
     return render_template(
         "admin_dashboard.html",
-        pages=pages,
         buttons=buttons,
-        organization=organization
+        organization=organization,
+        last_gc=last_gc,
     )
 
+# ---------- Admin API (списки с keyset-пагинацией) ----------
+API_PAGE_LIMIT = 50
+API_MAX_LIMIT = 200
+PAGE_LIST_COLUMNS = """p.id, p.title, p.image_path,
+    (SELECT COUNT(*) FROM page_pdfs d WHERE d.page_id = p.id) AS pdf_count"""
+BUTTON_LIST_COLUMNS = "b.id, b.title, b.color, b.page_id, b.icon_path, b.position, p.title AS page_title"
+# sort -> столбцы ключа; к каждому добавляется id, чтобы ключ был уникальным
+PAGE_SORTS = {"id": ("p.id",), "title": ("p.title", "p.id")}
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, ensure_ascii=False).encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        abort(400, "bad cursor")
+    if not isinstance(values, list) or len(values) != size:
+        abort(400, "bad cursor")
+    return values
+
+def _api_limit():
+    return max(1, min(request.args.get("limit", API_PAGE_LIMIT, type=int), API_MAX_LIMIT))
+
+def _keyset(columns, descending, after):
+    """(условие WHERE, параметры, ORDER BY) для страницы после курсора after."""
+    direction = "DESC" if descending else "ASC"
+    order = ", ".join(f"{column} {direction}" for column in columns)
+    if after is None:
+        return None, [], order
+    values = _decode_cursor(after, len(columns))
+    return f"({', '.join(columns)}) {'<' if descending else '>'} ({', '.join('?' * len(columns))})", values, order
+
+@app.route("/admin/api/pages")
+def admin_api_pages():
+    """Список страниц без content: ?limit=&after=<курсор>&sort=id|title&order=asc|desc
+    &q=<слова заголовка>&has_pdf=0|1&has_image=0|1. В ответе next — курсор
+    следующей порции (null, если дальше пусто)."""
+    if not session.get("auth"):
+        return jsonify(error="unauthorized"), 401
+    sort = request.args.get("sort", "id")
+    if sort not in PAGE_SORTS:
+        abort(400, "bad sort")
+    columns = PAGE_SORTS[sort]
+    descending = request.args.get("order", "desc" if sort == "id" else "asc") == "desc"
+    limit = _api_limit()
+
+    where, params = [], []
+    keyset, keyset_params, order = _keyset(columns, descending, request.args.get("after"))
+    if keyset:
+        where.append(keyset)
+        params += keyset_params
+    match = search.title_match(request.args.get("q", ""))
+    if match:
+        where.append("p.id IN (SELECT rowid FROM pages_fts WHERE pages_fts MATCH ?)")
+        params.append(match)
+    has_pdf = request.args.get("has_pdf", type=int)
+    if has_pdf is not None:
+        where.append(f"{'' if has_pdf else 'NOT '}EXISTS (SELECT 1 FROM page_pdfs d WHERE d.page_id = p.id)")
+    has_image = request.args.get("has_image", type=int)
+    if has_image is not None:
+        where.append("COALESCE(p.image_path, '') != ''" if has_image else "COALESCE(p.image_path, '') = ''")
+
+    conn = get_conn()
+    rows = conn.execute(
+        f"SELECT {PAGE_LIST_COLUMNS} FROM pages p"
+        f"{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order} LIMIT ?",
+        params + [limit + 1],
+    ).fetchall()
+    conn.close()
+
+    items = [dict(row) for row in rows[:limit]]
+    key = [column.split(".", 1)[1] for column in columns]
+    next_cursor = _encode_cursor([items[-1][k] for k in key]) if len(rows) > limit else None
+    return jsonify(items=items, next=next_cursor)
+
+@app.route("/admin/api/buttons")
+def admin_api_buttons():
+    """Кнопки в порядке показа на киоске: ?limit=&after=<курсор>."""
+    if not session.get("auth"):
+        return jsonify(error="unauthorized"), 401
+    limit = _api_limit()
+    keyset, params, order = _keyset(("b.position", "b.id"), False, request.args.get("after"))
+    conn = get_conn()
+    rows = conn.execute(
+        f"SELECT {BUTTON_LIST_COLUMNS} FROM buttons b LEFT JOIN pages p ON p.id = b.page_id"
+        f"{' WHERE ' + keyset if keyset else ''} ORDER BY {order} LIMIT ?",
+        params + [limit + 1],
+    ).fetchall()
+    conn.close()
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = _encode_cursor([items[-1]["position"], items[-1]["id"]]) if len(rows) > limit else None
+    return jsonify(items=items, next=next_cursor)
+
+@app.route("/admin/api/layout", methods=["POST"])
+def admin_api_layout():
+    """{"ops": [...]} — пакет операций с раскладкой (см. layout.py), одной транзакцией."""
+    if not session.get("auth"):
+        return jsonify(error="unauthorized"), 401
+    data = request.get_json(silent=True) or {}
+    conn = get_conn()
+    try:
+        result = layout.apply_ops(conn, data.get("ops"))
+        for page_id in result["pages"]:
+            search.index_page(conn, page_id)
+        conn.commit()
+    except layout.LayoutError as e:
+        return jsonify(error=str(e)), 400
+    finally:
+        conn.close()  # без commit() — откат всего пакета
+    # новые заголовки страниц видны и на их собственных экранах — их проще перезагрузить целиком
+    bump_content_version("reload" if result["pages"] else "buttons")
+    return jsonify(result)
+
 @app.route("/admin/organization/update", methods=["POST"])
 def admin_organization_update():
     redir = require_auth()
@@ -235,9 +780,34 @@ def admin_organization_update():
             org.logo_path = logo_path
 
     orm.session.commit()
+    bump_content_version("organization")
     return redirect(url_for("admin"))
 
 # ---------- Pages CRUD ----------
+def _attach_pdfs(conn, page_id):
+    """PDF из формы страницы. С JS файлы уже загружены частями, и форма
+    присылает id завершённых загрузок (pdf_uploads[]); без JS — сами файлы
+    (pdfs[]) в пределах MAX_CONTENT_LENGTH. pdf_titles[i] — название i-го."""
+    titles = request.form.getlist("pdf_titles[]")
+
+    def title_for(i, filename):
+        custom = (titles[i] or "").strip() if i < len(titles) else ""
+        return custom or os.path.splitext(filename)[0]
+
+    rows = []
+    upload_ids = request.form.getlist("pdf_uploads[]")
+    if upload_ids:
+        for i, upload_id in enumerate(upload_ids):
+            taken = resumable_uploads.take(conn, upload_id) if upload_id else None
+            if taken:
+                rows.append((page_id, taken[0], title_for(i, taken[1])))
+    else:
+        for i, pdf_file in enumerate(request.files.getlist("pdfs[]")):
+            filename = save_file(pdf_file, conn)
+            if filename:
+                rows.append((page_id, filename, title_for(i, pdf_file.filename)))
+    conn.executemany("INSERT INTO page_pdfs(page_id, file_path, title) VALUES (?, ?, ?)", rows)
+
 @app.route("/admin/page/create", methods=["POST"])
 def admin_page_create():
     redir = require_auth()
@@ -247,33 +817,22 @@ def admin_page_create():
     content = request.form.get("content", "")
     image_file = request.files.get("image")
 
-    pdf_files = request.files.getlist("pdfs[]")
-    pdf_titles = request.form.getlist("pdf_titles[]")
-
     conn = get_conn()
     cur = conn.cursor()
 
-    image_path = save_file(image_file)
+    image_path = save_file(image_file, conn)
+    content, content_html = process_page_content(content, conn)
     cur.execute(
-        "INSERT INTO pages(title, content, image_path) VALUES (?, ?, ?)",
-        (title, content, image_path),
+        "INSERT INTO pages(title, content, content_html, image_path) VALUES (?, ?, ?, ?)",
+        (title, content, content_html, image_path),
     )
     page_id = cur.lastrowid
+    _attach_pdfs(conn, page_id)
 
-    for i, pdf_file in enumerate(pdf_files):
-        if pdf_file and getattr(pdf_file, "filename", ""):
-            filename = save_file(pdf_file)
-            custom_title = ""
-            if i < len(pdf_titles):
-                custom_title = (pdf_titles[i] or "").strip()
-            pdf_title = custom_title if custom_title else os.path.splitext(pdf_file.filename)[0]
-            cur.execute(
-                "INSERT INTO page_pdfs(page_id, file_path, title) VALUES (?, ?, ?)",
-                (page_id, filename, pdf_title),
-            )
-
+    search.index_page(conn, page_id)
     conn.commit()
     conn.close()
+    bump_content_version("page", id=page_id)
     return redirect(url_for("admin"))
 
 @app.route("/admin/page/edit/<int:pid>", methods=["GET", "POST"])
@@ -292,32 +851,23 @@ def admin_page_edit(pid):
         content = request.form.get("content", "")
         image_file = request.files.get("image")
 
-        pdf_files = request.files.getlist("pdfs[]")
-        pdf_titles = request.form.getlist("pdf_titles[]")
-
-        updates = {"title": title, "content": content}
-        image_path = save_file(image_file)
+        content, content_html = process_page_content(content, conn)
+        updates = {"title": title, "content": content, "content_html": content_html}
+        image_path = save_file(image_file, conn)
         if image_path:
             updates["image_path"] = image_path
+            if page_row["image_path"]:
+                delete_uploaded_file(page_row["image_path"], conn)
 
         set_clause = ", ".join([f"{k}=?" for k in updates.keys()])
         vals = list(updates.values()) + [pid]
         conn.execute(f"UPDATE pages SET {set_clause} WHERE id=?", vals)
+        _attach_pdfs(conn, pid)
 
-        for i, pdf_file in enumerate(pdf_files):
-            if pdf_file and getattr(pdf_file, "filename", ""):
-                filename = save_file(pdf_file)
-                custom_title = ""
-                if i < len(pdf_titles):
-                    custom_title = (pdf_titles[i] or "").strip()
-                pdf_title = custom_title if custom_title else os.path.splitext(pdf_file.filename)[0]
-                conn.execute(
-                    "INSERT INTO page_pdfs(page_id, file_path, title) VALUES (?, ?, ?)",
-                    (pid, filename, pdf_title),
-                )
-
+        search.index_page(conn, pid)
         conn.commit()
         conn.close()
+        bump_content_version("page", id=pid)
         return redirect(url_for("admin_page_edit", pid=pid))
 
     pdfs = conn.execute("SELECT * FROM page_pdfs WHERE page_id=?", (pid,)).fetchall()
@@ -332,16 +882,18 @@ def admin_page_delete(pid):
     conn = get_conn()
     pdfs = conn.execute("SELECT file_path FROM page_pdfs WHERE page_id=?", (pid,)).fetchall()
     for row in pdfs:
-        delete_uploaded_file(row["file_path"])
+        delete_uploaded_file(row["file_path"], conn)
     conn.execute("DELETE FROM page_pdfs WHERE page_id=?", (pid,))
 
     img = conn.execute("SELECT image_path FROM pages WHERE id=?", (pid,)).fetchone()
     if img and img["image_path"]:
-        delete_uploaded_file(img["image_path"])
+        delete_uploaded_file(img["image_path"], conn)
 
     conn.execute("DELETE FROM pages WHERE id=?", (pid,))
+    search.remove_page(conn, pid)
     conn.commit()
     conn.close()
+    bump_content_version("page", id=pid, deleted=True)
     return redirect(url_for("admin"))
 
 @app.route("/admin/page/pdf/delete/<int:pdf_id>", methods=["POST"])
@@ -352,10 +904,13 @@ def admin_page_pdf_delete(pdf_id):
     conn = get_conn()
     pdf = conn.execute("SELECT * FROM page_pdfs WHERE id=?", (pdf_id,)).fetchone()
     if pdf:
-        delete_uploaded_file(pdf["file_path"])
+        delete_uploaded_file(pdf["file_path"], conn)
         conn.execute("DELETE FROM page_pdfs WHERE id=?", (pdf_id,))
+        search.index_page(conn, pdf["page_id"])
         conn.commit()
     conn.close()
+    if pdf:
+        bump_content_version("page", id=pdf["page_id"])
     return jsonify({"success": True})
 
 # ---------- Buttons CRUD ----------
@@ -382,6 +937,7 @@ def admin_button_create():
     )
     conn.commit()
     conn.close()
+    bump_content_version("buttons")
     return redirect(url_for("admin"))
 
 @app.route("/admin/button/update/<int:bid>", methods=["POST"])
@@ -395,28 +951,25 @@ def admin_button_update(bid):
     page_id = request.form.get("page_id")
     icon_file = request.files.get("icon")
 
-    icon_path = None
-    if icon_file and icon_file.filename:
-        filename = secure_filename(icon_file.filename)
-        full_path = UPLOAD_FOLDER / filename
-        try:
-            icon_file.save(full_path)
-            icon_path = f"buttons/{filename}"  # путь для фронтенда
-            print(f"Файл сохранён: {full_path}")
-        except Exception as e:
-            print(f"Ошибка сохранения файла: {e}")
+    # Иконка идёт через общий save_file: кладётся туда, откуда её отдаёт
+    # uploads(), и получает уменьшенные копии
+    icon_path = save_file(icon_file) if icon_file and icon_file.filename else None
 
     conn = get_conn()
     cur = conn.cursor()
     updates = {"title": title, "color": color, "page_id": page_id}
     if icon_path:
         updates["icon_path"] = icon_path
+        old = conn.execute("SELECT icon_path FROM buttons WHERE id=?", (bid,)).fetchone()
+        if old and old["icon_path"]:
+            delete_uploaded_file(old["icon_path"], conn)
 
     set_clause = ", ".join([f"{k}=?" for k in updates.keys()])
     vals = list(updates.values()) + [bid]
     cur.execute(f"UPDATE buttons SET {set_clause} WHERE id=?", vals)
     conn.commit()
     conn.close()
+    bump_content_version("buttons")
 
     return jsonify({"success": True, "icon_path": icon_path})
 
@@ -428,9 +981,13 @@ def admin_button_delete(bid):
     redir = require_auth()
     if redir: return redir
     conn = get_conn()
+    icon = conn.execute("SELECT icon_path FROM buttons WHERE id=?", (bid,)).fetchone()
+    if icon and icon["icon_path"]:
+        delete_uploaded_file(icon["icon_path"], conn)
     conn.execute("DELETE FROM buttons WHERE id=?", (bid,))
     conn.commit()
     conn.close()
+    bump_content_version("buttons")
     return redirect(url_for("admin"))
 
 @app.route("/admin/button/reorder", methods=["POST"])
@@ -439,10 +996,10 @@ def admin_button_reorder():
     if redir: return redir
     data = request.get_json()
     conn = get_conn()
-    for item in data:
-        conn.execute("UPDATE buttons SET position=? WHERE id=?", (item['position'], item['id']))
+    conn.executemany("UPDATE buttons SET position=? WHERE id=?", [(item['position'], item['id']) for item in data])
     conn.commit()
     conn.close()
+    bump_content_version("buttons")
     return jsonify({"success": True})
 
 @app.route("/admin/page/<int:pid>/delete_pdf/<int:pdf_id>", methods=["POST"])
@@ -451,13 +1008,230 @@ def delete_pdf(pid, pdf_id):
     conn.execute("DELETE FROM pdfs WHERE id=? AND page_id=?", (pdf_id, pid))
     conn.commit()
     conn.close()
+    bump_content_version("page", id=pid)
     flash("PDF удалён", "success")
     return redirect(url_for("admin_page_edit", pid=pid))
 
+# ---------- События для киосков (SSE) ----------
+def _sse(event_id, kind, payload):
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload or '{}'}\n\n"
+
+def _events_since(last_id):
+    conn = get_conn()
+    try:
+        return conn.execute(
+            "SELECT id, kind, payload FROM change_events WHERE id > ? ORDER BY id LIMIT 200",
+            (last_id,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+class _StreamSlots:
+    """Счётчик открытых потоков /events в процессе."""
+
+    def __init__(self):
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit):
+        with self._lock:
+            if self.open >= limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+event_streams = _StreamSlots()
+
+@app.route("/events")
+def events():
+    """Долгоживущий поток изменений контента.
+
+    Пока версия контента не меняется, поток проверяет только файл версии
+    (stat) и раз в EVENTS_HEARTBEAT_INTERVAL шлёт комментарий-пинг. При
+    переподключении браузер присылает Last-Event-ID и получает пропущенное;
+    если пропущенные события уже удалены — приходит событие reload.
+
+    Если в процессе уже EVENTS_MAX_CLIENTS потоков, ответ короткий: пропущенное
+    и retry на EVENTS_OVERFLOW_RETRY — киоск опрашивает, а не держит поток.
+    """
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    poll = app.config["EVENTS_POLL_INTERVAL"]
+    heartbeat = app.config["EVENTS_HEARTBEAT_INTERVAL"]
+
+    conn = get_conn()
+    try:
+        oldest, newest = conn.execute("SELECT MIN(id), MAX(id) FROM change_events").fetchone()
+    finally:
+        conn.close()
+    newest = newest or 0
+
+    try:
+        last_id = int(last_id)
+    except (TypeError, ValueError):
+        last_id = None
+
+    def stream(last_id):
+        # Слот берётся при первой отдаче: поток, который так и не начали, не держит его
+        follow = event_streams.acquire(app.config["EVENTS_MAX_CLIENTS"])
+        try:
+            retry = poll * 3 if follow else app.config["EVENTS_OVERFLOW_RETRY"]
+            yield f"retry: {int(retry * 1000)}\n\n"
+            if last_id is None:
+                last_id = newest
+                if not follow:
+                    yield f"id: {newest}\n\n"  # чтобы при переподключении прислал Last-Event-ID
+            elif last_id > newest or (oldest is not None and last_id < oldest - 1):
+                yield _sse(newest, "reload", None)
+                last_id = newest
+            if not follow:
+                for row in _events_since(last_id):
+                    yield _sse(row["id"], row["kind"], row["payload"])
+                return
+
+            seen_version = None
+            last_beat = time.monotonic()
+            while True:
+                version = current_content_version()
+                if version != seen_version:
+                    seen_version = version
+                    for row in _events_since(last_id):
+                        last_id = row["id"]
+                        last_beat = time.monotonic()
+                        yield _sse(row["id"], row["kind"], row["payload"])
+                if time.monotonic() - last_beat >= heartbeat:
+                    last_beat = time.monotonic()
+                    yield ": ping\n\n"
+                time.sleep(poll)
+        finally:
+            if follow:
+                event_streams.release()
+
+    return Response(
+        stream_with_context(stream(last_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ---------- Uploads ----------
+def _sendfile_response(filename, etag):
+    """Пустой ответ с заголовками, по которым байты отдаёт фронт-прокси
+    (он же обрабатывает Range). 304 решаем сами — до прокси дело не доходит."""
+    path = safe_join(app.config["UPLOAD_FOLDER"], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    st = os.stat(path)
+    resp = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+    resp.last_modified = st.st_mtime
+    resp.set_etag(etag or f"{st.st_mtime_ns:x}-{st.st_size:x}")
+    if app.config["UPLOADS_SENDFILE"] == "x-accel-redirect":
+        resp.headers["X-Accel-Redirect"] = quote(app.config["UPLOADS_ACCEL_PREFIX"] + filename)
+    else:
+        resp.headers["X-Sendfile"] = path
+    return resp.make_conditional(request)
+
 @app.route("/uploads/<path:filename>")
 def uploads(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+    """Файлы загрузок с Range/If-Range, ETag/Last-Modified и 304 (werkzeug).
+
+    Accept-Ranges объявляется и в полном ответе: без него PDF-просмотрщик
+    браузера не решается грузить документ по кускам и ждёт весь файл.
+    """
+    immutable = is_content_addressed(filename)
+    # у файлов из хранилища ETag — само имя с хэшем, одинаковое на всех серверах
+    etag = filename.rsplit("/", 1)[-1] if immutable else None
+    if app.config["UPLOADS_SENDFILE"]:
+        resp = _sendfile_response(filename, etag)
+    else:
+        resp = send_from_directory(app.config["UPLOAD_FOLDER"], filename, etag=etag or True)
+        resp.headers.setdefault("Accept-Ranges", "bytes")
+    if immutable:
+        # Имя = хэш содержимого: по этому URL никогда не будет других байтов
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    if resp.content_length:
+        metrics.upload_bytes.inc(resp.content_length, str(resp.status_code))
+    return resp
+
+# ---------- Загрузка файлов частями (большие PDF из админки) ----------
+@app.errorhandler(UploadError)
+def _upload_error(e):
+    return jsonify(error=str(e)), e.status
+
+def _uploads_api_auth():
+    if not session.get("auth"):
+        return jsonify(error="unauthorized"), 401
+    return None
+
+@app.route("/admin/uploads", methods=["POST"])
+def admin_upload_create():
+    """{filename, size} -> сессия: id, chunk_size, chunks, received."""
+    denied = _uploads_api_auth()
+    if denied: return denied
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get("filename") or "")
+    if not allowed_file(filename):
+        raise UploadError("недопустимый тип файла")
+    conn = get_conn()
+    try:
+        # заодно убрать брошенные сессии
+        for path in resumable_uploads.expire(conn, app.config["UPLOAD_SESSION_TTL"]):
+            delete_uploaded_file(path, conn)
+        conn.commit()
+        return jsonify(resumable_uploads.create(conn, filename, data.get("size"))), 201
+    finally:
+        conn.close()
+
+@app.route("/admin/uploads/<upload_id>", methods=["GET", "DELETE"])
+def admin_upload_session(upload_id):
+    """GET — какие части уже приняты (для докачки); DELETE — отменить загрузку."""
+    denied = _uploads_api_auth()
+    if denied: return denied
+    conn = get_conn()
+    try:
+        if request.method == "GET":
+            return jsonify(resumable_uploads.status(conn, upload_id))
+        path = resumable_uploads.discard(conn, upload_id)
+        if path:
+            delete_uploaded_file(path, conn)
+        conn.commit()
+        return "", 204
+    finally:
+        conn.close()
+
+@app.route("/admin/uploads/<upload_id>/<int:index>", methods=["PUT"])
+def admin_upload_chunk(upload_id, index):
+    """Часть index сырым телом запроса; части можно слать параллельно и повторно."""
+    denied = _uploads_api_auth()
+    if denied: return denied
+    if request.content_length is None:
+        raise UploadError("нужен Content-Length", 411)
+    conn = get_conn()
+    try:
+        received = resumable_uploads.write_chunk(conn, upload_id, index, request.stream, request.content_length)
+    finally:
+        conn.close()
+    return jsonify(received=received)
+
+@app.route("/admin/uploads/<upload_id>/complete", methods=["POST"])
+def admin_upload_complete(upload_id):
+    """Собрать файл в хранилище; к странице его привяжет форма по id."""
+    denied = _uploads_api_auth()
+    if denied: return denied
+    conn = get_conn()
+    try:
+        result = resumable_uploads.complete(conn, upload_id)
+        if result:
+            relpath, sha, size, created = result
+            _add_upload_ref(conn, relpath, sha, size)
+            conn.commit()
+            if created:
+                image_pipeline.submit(relpath)
+        return jsonify(resumable_uploads.status(conn, upload_id))
+    finally:
+        conn.close()
 
 # ---------- TinyMCE Image Upload (и алиас под /admin/...) ----------
 @app.route("/upload_image", methods=["POST"])
@@ -474,9 +1248,43 @@ def upload_image():
     file_url = url_for("uploads", filename=filename)
     return jsonify({"location": file_url})
 
-# ---------- QR: сохранить значение в БД, отдать значение, сгенерировать PNG ----------
+# ---------- QR: сохранить значение в БД, отдать значение, отдать картинку ----------
+QR_SIZE = 240  # px; на киоске QR показывается 120x120, запас под HiDPI
+qr_cache = QrCache(INSTANCE_DIR / "qr")
+
+def qr_url(value, fmt="png"):
+    """Неизменяемый URL картинки QR для значения (None, если значения нет)."""
+    if not value:
+        return None
+    return url_for("qr_image", key=qr_key(value, QR_SIZE), fmt=fmt)
+
+def _qr_image_bytes(key, fmt):
+    data = qr_cache.get(key, fmt)
+    if data is None:
+        # В кэше нет — рисуем, только если ключ от текущего значения организации
+        org = Organization.query.first()
+        value = org.qr_value if org else None
+        if not value or qr_key(value, QR_SIZE) != key:
+            return None
+        data = qr_cache.get(key, fmt, value, QR_SIZE)
+    return data
+
+@app.route("/qr/<key>.<fmt>")
+def qr_image(key, fmt):
+    if fmt not in QR_FORMATS:
+        abort(404)
+    data = _qr_image_bytes(key, fmt)
+    if data is None:
+        abort(404)
+    resp = Response(data, mimetype=QR_FORMATS[fmt])
+    resp.set_etag(key)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp.make_conditional(request)
+
 @app.route('/admin/save_qr', methods=['POST'])
 def save_qr():
+    if not session.get("auth"):
+        return jsonify(success=False, error="unauthorized"), 401
     data = request.get_json(silent=True) or {}
     qr_value = data.get('value', '').strip()
 
@@ -491,34 +1299,419 @@ def save_qr():
         org.qr_value = qr_value
 
     orm.session.commit()
-    return jsonify(success=True)
+    bump_content_version("qr", value=qr_value, url=qr_url(qr_value))
+    return jsonify(success=True, qr_url=qr_url(qr_value))
 
 @app.route('/get_qr')
 def get_qr():
     org = Organization.query.first()
-    return jsonify(value=(org.qr_value if org and org.qr_value else ''))
+    value = org.qr_value if org and org.qr_value else ''
+    return jsonify(value=value, url=qr_url(value))
 
 @app.route('/generate_qr', methods=['POST'])
 def generate_qr():
+    # Рисует картинку и кладёт её на диск — только для админки
+    if not session.get("auth"):
+        return jsonify({"error": "unauthorized"}), 401
     data = request.form.get('site', '').strip()
     if not data:
         return jsonify({"error": "Введите ссылку"}), 400
 
-    filename = "temp_qr.png"
-    folder = os.path.join("static", "qr")
-    filepath = os.path.join(folder, filename)
-    os.makedirs(folder, exist_ok=True)
+    # Кладём картинку в кэш заранее: /qr/ по ключу произвольного значения не нарисует
+    qr_cache.get(qr_key(data, QR_SIZE), "png", data, QR_SIZE)
+    return jsonify({"qr_url": qr_url(data)})
+
+# ---------- Статический экспорт ----------
+def _export_targets():
+    """{URL страницы: отпечаток всего, от чего зависит её HTML}."""
+    conn = get_conn()
+    org = conn.execute("SELECT name, logo_path, qr_value FROM organization ORDER BY id LIMIT 1").fetchone()
+    derivatives = {}
+    for row in conn.execute("SELECT source, width, format, path FROM image_derivatives ORDER BY source, width, format"):
+        derivatives.setdefault(row["source"], []).append(tuple(row)[1:])
+    buttons = [tuple(row) for row in conn.execute("SELECT * FROM buttons ORDER BY position, id")]
+    pdfs = {}
+    for row in conn.execute("SELECT page_id, id, file_path, title FROM page_pdfs ORDER BY id"):
+        pdfs.setdefault(row["page_id"], []).append(tuple(row)[1:])
+    pages = conn.execute("SELECT id, title, image_path, content, content_html FROM pages").fetchall()
+    conn.close()
+
+    templates = sorted(
+        (p.name, p.stat().st_mtime_ns) for p in Path(app.root_path, app.template_folder).glob("*.html")
+    )
+    logo = org["logo_path"] if org else None
+    common = fingerprint(
+        tuple(org) if org else None, derivatives.get(logo), templates,
+        {rel: entry["hash"] for rel, entry in assets.manifest.items()},
+    )
+    targets = {"/kiosk": fingerprint(common, buttons, [derivatives.get(b[-1]) for b in buttons])}
+    for p in pages:
+        targets[f"/page/{p['id']}"] = fingerprint(common, tuple(p), pdfs.get(p["id"]), derivatives.get(p["image_path"]))
+    return targets
+
+def _export_files(url):
+    """Файлы экспорта для URL из страницы: [(путь в экспорте, Path или bytes)]."""
+    if url.startswith("/static/"):
+        rel, entry, _ = assets.resolve(unquote(url[len("/static/"):]))
+        source = Path(app.static_folder) / rel
+        if entry is None:
+            return [(f"static/{rel}", source)] if source.is_file() else []
+        name = assets.url_name(rel)
+        return [(f"static/{name}", source)] + [
+            (f"static/{name}.{enc}", assets.encoded_path(rel, enc)) for enc in entry["encodings"]
+        ]
+    if url.startswith("/uploads/"):
+        filename = unquote(url[len("/uploads/"):])
+        path = safe_join(app.config["UPLOAD_FOLDER"], filename)
+        return [(f"uploads/{filename}", Path(path))] if path and os.path.isfile(path) else []
+    if url.startswith("/qr/"):
+        key, _, fmt = url[len("/qr/"):].partition(".")
+        data = _qr_image_bytes(key, fmt) if fmt in QR_FORMATS else None
+        return [(f"qr/{key}.{fmt}", data)] if data else []
+    return []
+
+static_export = StaticExporter(app.config["STATIC_EXPORT_DIR"] or INSTANCE_DIR / "export", app.test_client, _export_files)
+
+def export_static(out_dir=None, full=False):
+    """Собрать (или дособрать) статический экспорт киоска."""
+    exporter = static_export if out_dir is None else StaticExporter(out_dir, app.test_client, _export_files)
+    with app.app_context():
+        return exporter.build(_export_targets(), full=full)
+
+@app.cli.command("export-static")
+@click.option("--out", type=click.Path(file_okay=False), help="каталог экспорта (по умолчанию STATIC_EXPORT_DIR или instance/export)")
+@click.option("--full", is_flag=True, help="перерисовать всё, не глядя на прошлую сборку")
+def export_static_command(out, full):
+    """Выгрузить /kiosk, все страницы, QR и файлы в каталог для nginx."""
+    stats = export_static(out, full)
+    print(f"в {out or static_export.out_dir}: отрисовано {stats['rendered']}, без изменений {stats['skipped']}, "
+          f"скопировано файлов {stats['copied']}, удалено {stats['removed']} за {stats['seconds']} с")
+    for error in stats["errors"]:
+        print(f"ошибка: {error}")
+
+# ---------- Офлайн-режим киоска ----------
+def _offline_file_hash(url):
+    if url.startswith("/static/"):
+        _, entry, _ = assets.resolve(unquote(url[len("/static/"):]))
+        return entry["hash"] if entry else None
+    if url.startswith("/uploads/"):
+        filename = unquote(url[len("/uploads/"):])
+        if is_content_addressed(filename):
+            return filename.rsplit("/", 1)[-1]  # имя и есть хэш содержимого
+        path = safe_join(app.config["UPLOAD_FOLDER"], filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        st = os.stat(path)
+        return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    if url.startswith("/qr/"):
+        key, _, fmt = url[len("/qr/"):].partition(".")
+        return key if fmt in QR_FORMATS else None
+    return None
+
+offline_manifest = OfflineManifest(INSTANCE_DIR / "offline", app.test_client, _offline_file_hash)
+
+def offline_version():
+    """Версия манифеста — версия контента и сборка: после выкладки с новыми
+    шаблонами или статикой киоск синхронизируется, даже если контент тот же."""
+    return f"{current_content_version()}-{render_cache.build}"
+
+def build_offline_manifest():
+    """Собрать манифест текущей версии (в фоновом потоке offline_manifest)."""
+    with app.app_context():
+        offline_manifest.ensure(offline_version(), _export_targets)
+
+@app.route("/offline/manifest.json")
+@render_cache.cached(current_content_version)
+def offline_manifest_view():
+    """Всё, что киоску нужно без сети, с хэшами. Между правками — 304 по ETag.
+    Манифест читается готовым с диска; если его ещё нет — 503, сборка в фоне."""
+    manifest = offline_manifest.load(offline_version())
+    if manifest is None:
+        offline_manifest.schedule(build_offline_manifest, app.config["OFFLINE_MANIFEST_DELAY"])
+        return jsonify(error="building"), 503, {"Retry-After": str(app.config["OFFLINE_MANIFEST_RETRY"])}
+    return jsonify(manifest)
+
+@app.route("/sw.js")
+def service_worker():
+    # С корня сайта, а не из /static/: область service worker — его каталог
+    resp = send_from_directory(app.static_folder, "js/sw.js", max_age=0)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+# ---------- Статистика киосков ----------
+def _flush_analytics(events):
+    """Вызывается из потока EventBuffer."""
+    with app.app_context():
+        conn = get_conn()
+        try:
+            analytics.write_batch(conn, events, app.config["ANALYTICS_KEEP_DAYS"])
+        finally:
+            conn.close()
+
+analytics_buffer = analytics.EventBuffer(_flush_analytics, interval=app.config["ANALYTICS_FLUSH_INTERVAL"])
+atexit.register(analytics_buffer.flush_now)
+
+@app.route("/analytics/events", methods=["POST"])
+def analytics_events():
+    """Пачка событий с киоска (fetch или sendBeacon); в БД — при сбросе буфера."""
+    events = analytics.parse_events(request.get_json(force=True, silent=True))
+    analytics_buffer.add(events[:app.config["ANALYTICS_MAX_BATCH"]])
+    return "", 204
+
+@app.route("/admin/analytics")
+def admin_analytics():
+    redir = require_auth()
+    if redir: return redir
+
+    days = min(max(request.args.get("days", 7, type=int), 1), 366)
+    since = time.strftime("%Y-%m-%d", time.localtime(time.time() - (days - 1) * 86400))
+    today = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+    conn = get_conn()
+    totals = dict(conn.execute(
+        "SELECT kind, SUM(count) FROM analytics_daily WHERE day >= ? GROUP BY kind", (since,)
+    ).fetchall())
+    by_day = {}
+    for row in conn.execute(
+        "SELECT day, kind, SUM(count) AS n FROM analytics_daily WHERE day >= ? GROUP BY day, kind ORDER BY day", (since,)
+    ):
+        by_day.setdefault(row["day"], {})[row["kind"]] = row["n"]
+    by_kiosk = {}
+    for row in conn.execute(
+        "SELECT kiosk, kind, SUM(count) AS n FROM analytics_daily WHERE day >= ? GROUP BY kiosk, kind ORDER BY kiosk", (since,)
+    ):
+        by_kiosk.setdefault(row["kiosk"], {})[row["kind"]] = row["n"]
+    by_hour = {}
+    for row in conn.execute(
+        "SELECT hour, kind, SUM(count) AS n FROM analytics_hourly WHERE hour >= ? GROUP BY hour, kind ORDER BY hour", (today,)
+    ):
+        by_hour.setdefault(time.strftime("%H:00", time.localtime(row["hour"])), {})[row["kind"]] = row["n"]
+
+    def top(kind, table, title_column):
+        return conn.execute(
+            f"""SELECT d.target, t.{title_column} AS title, SUM(d.count) AS n
+                FROM analytics_daily d LEFT JOIN {table} t ON t.id = d.target
+                WHERE d.kind = ? AND d.day >= ? GROUP BY d.target ORDER BY n DESC LIMIT 20""",
+            (kind, since),
+        ).fetchall()
+
+    top_pages = top("page_view", "pages", "title")
+    top_pdfs = top("pdf_open", "page_pdfs", "title")
+    top_tiles = top("tile_tap", "buttons", "title")
+    conn.close()
+
+    return render_template(
+        "admin_analytics.html",
+        days=days, kinds=analytics.KINDS, totals=totals, by_day=by_day, by_kiosk=by_kiosk, by_hour=by_hour,
+        top_pages=top_pages, top_pdfs=top_pdfs, top_tiles=top_tiles, pending=analytics_buffer.pending(),
+    )
+
+# ---------- Перенос контента (архив) ----------
+content_jobs = Jobs(INSTANCE_DIR / "jobs")
+
+def export_content():
+    """Генератор tar-архива с контентом и файлами (см. archive.py)."""
+    return archive.export_stream(get_conn, upload_store, UPLOAD_REF_COLUMNS)
 
-    img = qrcode.make(data)
-    img.save(filepath)
+def import_content(fileobj, total=0, progress=None):
+    """Заменить контент содержимым архива. progress(stage, done, total)."""
+    progress = progress or (lambda stage, done, total: None)
+    tables, files = archive.read_archive(
+        fileobj, upload_store, allowed_file, lambda read: progress("files", read, total))
+
+    progress("database", 0, 0)
+    renamed = {old: entry[0] for old, entry in files.items() if entry[0] != old}
+    stored = {entry[0]: entry for entry in files.values()}
+    conn = get_conn()
+    try:
+        # ссылки считаются так же, как для новых строк: столбцы + картинки в HTML страниц
+        old_refs = archive.referenced_uploads(
+            {table: [dict(row) for row in conn.execute(f"SELECT * FROM {table}")] for table in archive.TABLES},
+            UPLOAD_REF_COLUMNS)
+        counts = archive.replace_content(conn, tables, renamed, UPLOAD_REF_COLUMNS)
+        # сначала ссылки новых строк, потом снять ссылки старых: общий файл не должен удалиться
+        for path, n in archive.referenced_uploads(tables, UPLOAD_REF_COLUMNS).items():
+            if path in stored:
+                _add_upload_ref(conn, path, stored[path][1], stored[path][2], n)
+        for path, n in old_refs.items():
+            for _ in range(n):
+                delete_uploaded_file(path, conn)
+        progress("search", 0, 0)
+        search.rebuild(conn)
+        conn.commit()
+    finally:
+        conn.close()
 
-    return jsonify({"qr_url": url_for('static', filename=f'qr/{filename}')})
+    for relpath, _, _, created in files.values():
+        if created:
+            image_pipeline.submit(relpath)
+    bump_content_version("reload")
+    return {"counts": counts, "files": len(files), "new_files": sum(1 for entry in files.values() if entry[3])}
+
+@app.cli.command("export-content")
+@click.argument("out", type=click.Path(dir_okay=False, writable=True))
+def export_content_command(out):
+    """Выгрузить страницы, кнопки, организацию и их файлы в tar-архив."""
+    with open(out, "wb") as f:
+        for chunk in export_content():
+            f.write(chunk)
+    print(f"{out}: {os.path.getsize(out) / 1024 / 1024:.1f} МБ")
+
+@app.cli.command("import-content")
+@click.argument("archive_path", type=click.Path(exists=True, dir_okay=False))
+def import_content_command(archive_path):
+    """Заменить контент содержимым архива из export-content."""
+    started = time.perf_counter()
+    with open(archive_path, "rb") as f:
+        result = import_content(f, os.path.getsize(archive_path))
+    print(f"импортировано за {time.perf_counter() - started:.1f} с: {result}")
+    image_pipeline.shutdown()
+
+@app.route("/admin/content/export")
+def admin_content_export():
+    redir = require_auth()
+    if redir: return redir
+    name = time.strftime("kiosk-content-%Y%m%d-%H%M%S.tar")
+    return Response(stream_with_context(export_content()), mimetype="application/x-tar",
+                    headers={"Content-Disposition": f"attachment; filename={name}"})
+
+@app.route("/admin/content/import", methods=["POST"])
+def admin_content_import():
+    """Архив сырым телом запроса -> фоновый импорт; ответ сразу, с id задачи."""
+    denied = _uploads_api_auth()
+    if denied: return denied
+    length = request.content_length
+    if not length:
+        return jsonify(error="нужен Content-Length"), 411
+    if length > app.config["CONTENT_IMPORT_MAX_BYTES"]:
+        return jsonify(error="архив слишком большой"), 413
+
+    # Тело читается мимо request.stream: на него действует MAX_CONTENT_LENGTH,
+    # а у архива свой предел (проверен выше). На диск — блоками.
+    job_id = content_jobs.new_id()
+    path = content_jobs.root / f"{job_id}.tar"
+    content_jobs.root.mkdir(parents=True, exist_ok=True)
+    stream = LimitedStream(request.environ["wsgi.input"], length)
+    received = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = stream.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+            received += len(chunk)
+    if received != length:
+        path.unlink()
+        return jsonify(error="архив пришёл не полностью"), 400
+
+    def run(job):
+        try:
+            with app.app_context(), open(path, "rb") as archive_file:
+                return import_content(archive_file, length,
+                                      lambda stage, done, total: job.update(stage=stage, done=done, total=total))
+        finally:
+            path.unlink()
+
+    content_jobs.start("import", run, job_id)
+    return jsonify(id=job_id), 202
+
+@app.route("/admin/content/jobs/<job_id>")
+def admin_content_job(job_id):
+    denied = _uploads_api_auth()
+    if denied: return denied
+    state = content_jobs.get(job_id)
+    if state is None:
+        return jsonify(error="not found"), 404
+    return jsonify(state)
+
+# ---------- Уборка неиспользуемых загрузок ----------
+# Старые иконки кнопок записаны в БД как buttons/<имя> от родителя UPLOAD_FOLDER
+upload_gc = UploadGC(
+    UPLOAD_DIR,
+    [(UPLOAD_DIR, None)] + ([(UPLOAD_FOLDER.parent, (UPLOAD_FOLDER.name,))] if UPLOAD_FOLDER else []),
+    UPLOAD_REF_COLUMNS,
+    grace=app.config["UPLOAD_GC_GRACE"], interval=app.config["UPLOAD_GC_INTERVAL"],
+)
+
+def _upload_gc_conn():
+    """Соединение для потоков сборщика: им нужен контекст приложения только ради пула."""
+    with app.app_context():
+        return get_conn()
+
+@app.cli.command("gc-uploads")
+@click.option("--grace", type=float, default=None, help="сек; по умолчанию UPLOAD_GC_GRACE, 0 — удалить сразу")
+def gc_uploads_command(grace):
+    """Удалить файлы загрузок, на которые ничего не ссылается."""
+    report = upload_gc.run(_upload_gc_conn, grace=grace)
+    print(f"удалено {report['deleted_files']} файлов, {report['deleted_bytes'] / 1024 / 1024:.1f} МБ; "
+          f"ждут удаления {report['pending_files']} ({report['pending_bytes'] / 1024 / 1024:.1f} МБ); "
+          f"исправлено счётчиков {report['fixed_refs']}, ссылок на отсутствующие файлы {report['missing_files']}")
+
+@app.route("/admin/uploads/gc", methods=["GET", "POST"])
+def admin_upload_gc():
+    """GET — последние прогоны; POST — прогон сейчас, фоновой задачей (см. /admin/content/jobs/<id>)."""
+    denied = _uploads_api_auth()
+    if denied: return denied
+    if request.method == "POST":
+        job_id = content_jobs.start("upload-gc", lambda job: upload_gc.run(_upload_gc_conn))
+        return jsonify(id=job_id), 202
+    conn = get_conn()
+    runs = conn.execute("SELECT * FROM upload_gc_runs ORDER BY id DESC LIMIT 20").fetchall()
+    conn.close()
+    return jsonify(runs=[dict(row) for row in runs])
 
 # ---------- Root ----------
 @app.route("/")
 def root():
     return redirect(url_for("kiosk"))
 
+# ---------- Фабрика приложения ----------
+def _after_fork():
+    """В дочернем процессе после fork (gunicorn --preload): соединения,
+    открытые мастером, не трогаем — у воркера будет свой пул. Фоновые
+    потоки (производные изображений, экспорт, статистика) запускаются
+    лениво и рождаются уже в воркере."""
+    with app.app_context():
+        orm.engine.dispose(close=False)
+
+def create_app(config=None):
+    """Подготовить приложение к работе: настройки, каталоги, пул БД, статика.
+
+    Импорт app.py ничего не пишет на диск и не ходит в БД, а create_app()
+    не трогает схему — её ведут миграции (`flask --app wsgi db upgrade`).
+    Маршруты объявлены на уровне модуля, поэтому приложение одно на процесс:
+    повторный вызов просто возвращает его.
+    """
+    if "sqlalchemy" in app.extensions:
+        return app
+    app.config.update(config or {})
+    for path in (INSTANCE_DIR, UPLOAD_DIR):
+        path.mkdir(parents=True, exist_ok=True)
+
+    orm.init_app(app)
+    with app.app_context():
+        event.listen(orm.engine, "connect", _configure_sqlite)
+        event.listen(orm.engine.pool, "checkin", _reset_row_factory)
+        metrics.track_engine(orm.engine)
+
+    # Объекты, созданные при импорте, — по итоговым настройкам
+    metrics.slow_request_ms = app.config["SLOW_REQUEST_MS"]
+    render_cache.max_bytes = app.config["RENDER_CACHE_MAX_BYTES"]
+    resumable_uploads.max_file_bytes = app.config["UPLOAD_MAX_FILE_BYTES"]
+    resumable_uploads.chunk_bytes = app.config["UPLOAD_CHUNK_BYTES"]
+    analytics_buffer.interval = app.config["ANALYTICS_FLUSH_INTERVAL"]
+    static_export.out_dir = Path(app.config["STATIC_EXPORT_DIR"] or INSTANCE_DIR / "export")
+    upload_gc.grace = app.config["UPLOAD_GC_GRACE"]
+    upload_gc.interval = app.config["UPLOAD_GC_INTERVAL"]
+
+    assets.build()  # без изменений в static/ — только stat файлов
+    render_cache.build = _build_identity()
+    if os.environ.get("FLASK_RUN_FROM_CLI"):  # выставляет CLI flask: нужны команды `flask db`
+        _migrate()
+    os.register_at_fork(after_in_child=_after_fork)
+    return app
+
 if __name__ == "__main__":
-    init_db()
+    create_app()
+    with app.app_context():
+        init_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,195 @@
+"""Перенос контента между серверами (staging -> production) одним tar-архивом.
+
+Состав архива, по порядку:
+
+    manifest.json         формат, число строк по таблицам, объём файлов
+    data/<таблица>.jsonl  organization, pages, page_pdfs, buttons — строка на запись
+    uploads/<путь>        файлы, на которые ссылаются эти строки и HTML страниц
+
+Экспорт — генератор: таблицы читаются одним снимком БД во временные файлы
+(соединение не держится, пока архив скачивается), файлы загрузок отдаются
+блоками, и архив целиком нигде не собирается. Импорт читает архив потоком
+(tar "r|"): файлы кладутся в хранилище по хэшу, а те, что уже есть (путь в
+хранилище — это хэш содержимого), пропускаются; строки вставляются через
+executemany в одной транзакции и заменяют текущий контент.
+"""
+import json
+import re
+import tarfile
+import tempfile
+import time
+from collections import Counter
+
+from storage import CHUNK_SIZE, is_content_addressed
+
+FORMAT = 1
+TABLES = ("organization", "pages", "page_pdfs", "buttons")
+HTML_COLUMNS = ("content", "content_html")  # HTML страниц со ссылками /uploads/...
+UPLOAD_URL_RE = re.compile(r"/uploads/([^\"'\s?#)<>]+)")
+SPOOL_MAX = 8 * 1024 * 1024  # таблица больше — во временный файл на диске
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def referenced_uploads(tables, ref_columns):
+    """Counter путей загрузок: ссылки из столбцов + из HTML страниц (раз на страницу)."""
+    refs = Counter()
+    for table, column in ref_columns:
+        refs.update(row[column] for row in tables.get(table, ()) if row.get(column))
+    for row in tables.get("pages", ()):
+        found = set()
+        for column in HTML_COLUMNS:
+            found.update(UPLOAD_URL_RE.findall(row.get(column) or ""))
+        refs.update(found)
+    return refs
+
+
+# ---------- Экспорт ----------
+def _header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+
+def _padding(size):
+    return b"\0" * (-size % tarfile.BLOCKSIZE)
+
+
+def _stream_file(f, size):
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(CHUNK_SIZE * 16, remaining))
+        if not chunk:
+            raise ArchiveError("файл изменился во время экспорта")
+        remaining -= len(chunk)
+        yield chunk
+    yield _padding(size)
+
+
+def export_stream(conn_factory, store, ref_columns):
+    """Генератор байтов tar-архива."""
+    now = time.time()
+    spooled, counts, refs = [], {}, Counter()
+    conn = conn_factory()
+    try:
+        conn.execute("BEGIN")  # все таблицы — из одного снимка
+        for table in TABLES:
+            rows = [dict(row) for row in conn.execute(f"SELECT * FROM {table} ORDER BY id")]
+            refs += referenced_uploads({table: rows}, ref_columns)
+            f = tempfile.SpooledTemporaryFile(SPOOL_MAX)
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+            counts[table] = len(rows)
+            spooled.append((table, f))
+            del rows
+        conn.rollback()
+    finally:
+        conn.close()
+
+    files = []
+    for relpath in sorted(refs):
+        path = store.path(relpath)
+        if ".." not in relpath.split("/") and path.is_file():
+            files.append((relpath, path, path.stat().st_size))
+
+    manifest = json.dumps({
+        "format": FORMAT, "exported_at": now, "counts": counts,
+        "files": len(files), "file_bytes": sum(size for _, _, size in files),
+    }, ensure_ascii=False).encode("utf-8")
+    yield _header("manifest.json", len(manifest), now) + manifest + _padding(len(manifest))
+
+    for table, f in spooled:
+        with f:
+            size = f.tell()
+            f.seek(0)
+            yield _header(f"data/{table}.jsonl", size, now)
+            yield from _stream_file(f, size)
+
+    for relpath, path, size in files:
+        with open(path, "rb") as f:
+            yield _header(f"uploads/{relpath}", size, path.stat().st_mtime)
+            yield from _stream_file(f, size)
+
+    yield b"\0" * (tarfile.BLOCKSIZE * 2)  # конец архива
+
+
+# ---------- Импорт ----------
+class _CountingReader:
+    def __init__(self, f, on_read):
+        self.f = f
+        self.on_read = on_read
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.read_bytes += len(data)
+        self.on_read(self.read_bytes)
+        return data
+
+
+def read_archive(fileobj, store, allowed_file, progress=None):
+    """Разобрать архив потоком. Возвращает (tables, files): строки по таблицам
+    и {путь в архиве: (путь в хранилище, sha256, размер, создан ли файл)}."""
+    progress = progress or (lambda read_bytes: None)
+    tables, files, manifest = {}, {}, None
+    with tarfile.open(fileobj=_CountingReader(fileobj, progress), mode="r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            name = member.name
+            if name == "manifest.json":
+                manifest = json.load(tar.extractfile(member))
+                if manifest.get("format") != FORMAT:
+                    raise ArchiveError(f"неизвестный формат архива: {manifest.get('format')}")
+            elif name.startswith("data/") and name.endswith(".jsonl"):
+                table = name[len("data/"):-len(".jsonl")]
+                if table not in TABLES:
+                    continue
+                tables[table] = [json.loads(line) for line in tar.extractfile(member) if line.strip()]
+            elif name.startswith("uploads/"):
+                relpath = name[len("uploads/"):]
+                if not allowed_file(relpath):
+                    continue
+                if is_content_addressed(relpath) and store.path(relpath).is_file():
+                    sha = relpath.rsplit("/", 1)[-1].split(".", 1)[0]
+                    files[relpath] = (relpath, sha, member.size, False)  # такой файл уже есть
+                else:
+                    files[relpath] = store.save_stream(tar.extractfile(member), relpath.rsplit(".", 1)[1])
+    if manifest is None:
+        raise ArchiveError("в архиве нет manifest.json")
+    return tables, files
+
+
+def replace_content(conn, tables, renamed, ref_columns):
+    """Заменить строки TABLES строками из архива (в транзакции вызывающего).
+    renamed — {старый путь загрузки: новый}, если файл лёг в хранилище под другим именем."""
+    def rename_url(m):
+        return "/uploads/" + renamed.get(m.group(1), m.group(1))
+
+    for table in reversed(TABLES):  # сначала зависимые: buttons, page_pdfs
+        conn.execute(f"DELETE FROM {table}")
+    for table in TABLES:
+        rows = tables.get(table, [])
+        if not rows:
+            continue
+        # только столбцы, которые есть в этой БД: ключи из архива в SQL не попадают как есть
+        existing = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        columns = [c for c in existing if c in rows[0]]
+        if renamed:
+            path_columns = [c for t, c in ref_columns if t == table]
+            for row in rows:
+                for column in path_columns:
+                    row[column] = renamed.get(row.get(column), row.get(column))
+                if table == "pages":
+                    for column in HTML_COLUMNS:
+                        if row.get(column):
+                            row[column] = UPLOAD_URL_RE.sub(rename_url, row[column])
+        conn.executemany(
+            f"INSERT INTO {table}({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [tuple(row.get(c) for c in columns) for row in rows],
+        )
+    return {table: len(tables.get(table, [])) for table in TABLES}
@@ -0,0 +1,130 @@
+"""Статика с отпечатками и предсжатием (TinyMCE, theme.css, common.js, ...).
+
+При старте (или `flask build-assets`) каждый файл из static/ хэшируется и,
+если это текст, сжимается в .gz и .br (пакет Brotli из requirements.txt;
+без него строится только .gz).
+url_for('static', ...) выдаёт имя с отпечатком: css/theme.<hash>.css, и такой
+URL отдаётся с immutable-кэшем. Пересжимаются только изменившиеся файлы:
+манифест помнит размер и mtime каждого исходника.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # установка без requirements.txt: .br просто не строим
+    brotli = None
+
+HASH_LEN = 10
+COMPRESSIBLE = {".js", ".css", ".svg", ".html", ".json", ".txt", ".map", ".ts", ".xml", ".ico"}
+MIN_COMPRESS_SIZE = 512
+_HASHED_RE = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$" % HASH_LEN)
+
+
+def fingerprinted(relpath, digest):
+    stem, ext = os.path.splitext(relpath)
+    return f"{stem}.{digest}{ext}"
+
+
+class AssetPipeline:
+    def __init__(self, static_dir, build_dir, exclude=("uploads",)):
+        self.static_dir = Path(static_dir)
+        self.build_dir = Path(build_dir)
+        self.exclude = tuple(f"{name}/" for name in exclude)
+        self.manifest = {}   # relpath -> {"hash", "size", "mtime", "encodings"}
+        self._dir_hashes = {}
+
+    @property
+    def manifest_path(self):
+        return self.build_dir / "manifest.json"
+
+    def build(self):
+        """Пройти static/, досжать изменившееся, сохранить манифест."""
+        try:
+            old = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            old = {}
+
+        manifest = {}
+        for path in sorted(self.static_dir.rglob("*")):
+            if not path.is_file():
+                continue
+            rel = path.relative_to(self.static_dir).as_posix()
+            if rel.startswith(self.exclude) or rel.endswith((".gz", ".br")):
+                continue
+            st = path.stat()
+            prev = old.get(rel)
+            if prev and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime_ns \
+                    and all((self.build_dir / f"{rel}.{enc}").exists() for enc in prev["encodings"]):
+                manifest[rel] = prev
+                continue
+            data = path.read_bytes()
+            manifest[rel] = {
+                "hash": hashlib.sha256(data).hexdigest()[:HASH_LEN],
+                "size": st.st_size,
+                "mtime": st.st_mtime_ns,
+                "encodings": self._compress(rel, data),
+            }
+
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(manifest, indent=0, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+        self.manifest = manifest
+        self._dir_hashes = {}
+        return manifest
+
+    def _compress(self, rel, data):
+        if Path(rel).suffix.lower() not in COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+            return []
+        encodings = []
+        variants = [("gz", gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(("br", brotli.compress(data, quality=11)))
+        for enc, packed in variants:
+            if len(packed) >= len(data):
+                continue
+            dst = self.build_dir / f"{rel}.{enc}"
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(packed)
+            os.replace(tmp, dst)
+            encodings.append(enc)
+        return encodings
+
+    def url_name(self, relpath):
+        """Имя с отпечатком для url_for; неизвестные файлы — как есть."""
+        entry = self.manifest.get(relpath)
+        return fingerprinted(relpath, entry["hash"]) if entry else relpath
+
+    def resolve(self, requested):
+        """(исходный relpath, запись манифеста, immutable) для запрошенного имени."""
+        entry = self.manifest.get(requested)
+        if entry is not None:
+            return requested, entry, False
+        m = _HASHED_RE.match(requested)
+        if m:
+            rel = m.group("stem") + m.group("ext")
+            entry = self.manifest.get(rel)
+            if entry is not None:
+                # старый отпечаток после обновления — отдаём текущий файл, но без вечного кэша
+                return rel, entry, entry["hash"] == m.group("hash")
+        return requested, None, False
+
+    def dir_hash(self, prefix):
+        """Общий отпечаток каталога: для ресурсов, которые подгружаются по
+        относительным путям (плагины и скины TinyMCE) и получают ?v=<hash>."""
+        if prefix not in self._dir_hashes:
+            digest = hashlib.sha256()
+            for rel in sorted(self.manifest):
+                if rel.startswith(prefix + "/"):
+                    digest.update(f"{rel}:{self.manifest[rel]['hash']}\n".encode("utf-8"))
+            self._dir_hashes[prefix] = digest.hexdigest()[:HASH_LEN]
+        return self._dir_hashes[prefix]
+
+    def encoded_path(self, relpath, encoding):
+        return self.build_dir / f"{relpath}.{encoding}"
@@ -0,0 +1,7 @@
+"""Бенчмарки киоска. Каждый модуль запускается отдельно: python bench/<имя>.py
+
+load.py            — нагрузочный прогон маршрутов киоска и админки, JSON + базовая линия
+db_concurrency.py  — чтение киоска на фоне записей из админки
+pdf_range.py       — время до первой страницы большого PDF через Range
+search_fts.py      — задержка поиска по мере набора
+"""
@@ -0,0 +1,51 @@
+"""Общее для скриптов bench/: временный экземпляр приложения и статистика.
+
+use_temp_instance() нужно вызвать до `import app`: приложение читает
+KIOSK_DB_PATH, KIOSK_UPLOAD_DIR и KIOSK_INSTANCE_DIR при импорте, и рабочие
+database.db (с файлом версии контента рядом), static/uploads и instance/
+бенчмарками не трогаются.
+"""
+import os
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def use_temp_instance():
+    """Направить БД, загрузки и instance/ во временный каталог; вернуть его путь."""
+    tmp_dir = Path(tempfile.mkdtemp(prefix="kiosk-bench-"))
+    os.environ["KIOSK_DB_PATH"] = str(tmp_dir / "bench.db")
+    os.environ["KIOSK_UPLOAD_DIR"] = str(tmp_dir / "uploads")
+    os.environ["KIOSK_INSTANCE_DIR"] = str(tmp_dir / "instance")
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    return tmp_dir
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(timings, seconds=None, errors=0):
+    """Сводка по списку длительностей (в секундах): задержки в мс."""
+    ms = [t * 1000 for t in timings]
+    out = {"count": len(ms), "errors": errors}
+    if seconds:
+        out["rps"] = round(len(ms) / seconds, 1)
+    if ms:
+        out.update({
+            "mean_ms": round(statistics.fmean(ms), 2),
+            "p50_ms": round(statistics.median(ms), 2),
+            "p95_ms": round(percentile(ms, 0.95), 2),
+            "p99_ms": round(percentile(ms, 0.99), 2),
+        })
+    return out
+
+
+def report(name, timings):
+    s = summarize(timings)
+    print(f"{name:28s} p50 {s['p50_ms']:6.2f} мс   p95 {s['p95_ms']:6.2f} мс   p99 {s['p99_ms']:6.2f} мс")
@@ -0,0 +1,104 @@
+"""Пропускная способность чтения киоска на фоне записей из админки.
+
+Запуск:  python bench/db_concurrency.py [--readers 8] [--seconds 5]
+
+Скрипт создаёт временную БД (рабочая database.db не трогается), наполняет её
+страницами и кнопками, затем дважды гоняет /kiosk и /page/<pid> в несколько
+потоков: без записей и параллельно с потоком, который непрерывно
+редактирует страницы. Печатает req/s и число ошибок "database is locked".
+"""
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench.common import use_temp_instance  # noqa: E402
+
+use_temp_instance()
+
+import app as kiosk_app  # noqa: E402
+
+kiosk_app.create_app()
+
+
+def seed(pages):
+    conn = kiosk_app.get_conn()
+    conn.executemany(
+        "INSERT INTO pages(title, content) VALUES (?, ?)",
+        [(f"Страница {i}", "<p>" + "Текст страницы. " * 50 + "</p>") for i in range(pages)],
+    )
+    conn.executemany(
+        "INSERT INTO buttons(title, color, page_id, position) VALUES (?, ?, ?, ?)",
+        [(f"Кнопка {i}", "#0d6efd", i + 1, i) for i in range(min(pages, 24))],
+    )
+    conn.commit()
+    conn.close()
+
+
+def run_readers(readers, seconds, pages, writer=False):
+    stop = threading.Event()
+    counts = [0] * readers
+    errors = [0] * readers
+    writes = [0]
+
+    def reader(n):
+        client = kiosk_app.app.test_client()
+        i = n
+        while not stop.is_set():
+            url = "/kiosk" if i % 2 else f"/page/{i % pages + 1}"
+            try:
+                resp = client.get(url)
+                if resp.status_code == 200:
+                    counts[n] += 1
+                else:
+                    errors[n] += 1
+            except Exception:
+                errors[n] += 1
+            i += 1
+
+    def write_loop():
+        client = kiosk_app.app.test_client()
+        with client.session_transaction() as sess:
+            sess["auth"] = True
+        i = 0
+        while not stop.is_set():
+            pid = i % pages + 1
+            client.post(f"/admin/page/edit/{pid}", data={"title": f"Правка {i}", "content": "<p>x</p>" * 200})
+            writes[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    if writer:
+        threads.append(threading.Thread(target=write_loop))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(counts) / seconds, sum(errors), writes[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+
+    with kiosk_app.app.app_context():
+        kiosk_app.init_db()
+        seed(args.pages)
+
+    idle_rps, idle_err, _ = run_readers(args.readers, args.seconds, args.pages)
+    busy_rps, busy_err, writes = run_readers(args.readers, args.seconds, args.pages, writer=True)
+
+    print(f"чтение без записей:   {idle_rps:8.1f} req/s, ошибок: {idle_err}")
+    print(f"чтение под записями:  {busy_rps:8.1f} req/s, ошибок: {busy_err}, записей: {writes}")
+    print(f"сохранено пропускной способности: {busy_rps / idle_rps:.0%}")
+
+
+if __name__ == "__main__":
+    main()
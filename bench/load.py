@@ -0,0 +1,412 @@
+"""Нагрузочный прогон маршрутов киоска и админки с отчётом в JSON.
+
+Запуск:  python bench/load.py [--pages 200] [--buttons 24] [--pdfs 2] [--concurrency 8]
+                              [--seconds 10] [--out result.json]
+                              [--baseline bench/baseline.json] [--save-baseline]
+
+Скрипт создаёт временную БД и каталог загрузок, наполняет их через init_db()
+и ORM (N страниц, M кнопок, K PDF на страницу), поднимает приложение в
+отдельном процессе на свободном порту и гоняет по HTTP смесь запросов
+киоска (/kiosk, /page/<pid>, /uploads/..., /get_qr) и CRUD админки
+в --concurrency потоков. В stdout (или --out) печатается JSON: req/s и
+p50/p95/p99 по каждому маршруту и в целом.
+
+С --baseline результат сравнивается с сохранённым прогоном: маршрут считается
+регрессией, если его p95 вырос или req/s упал больше чем на --tolerance;
+тогда код выхода 1. --save-baseline записывает текущий прогон как базовую
+линию. Базовая линия зависит от машины — сохраняйте её на той же машине,
+где потом сравниваете.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench.common import ROOT, summarize, use_temp_instance  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+PDF_HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+RANGE_CHUNK = 64 * 1024
+MIN_SAMPLES = 20  # маршруты с меньшим числом запросов не сравниваются: p95 из пары точек — шум
+
+
+# ---------- Наполнение ----------
+def seed(pages, buttons, pdfs, pdf_kb, rng):
+    """Заполнить временную БД; вернуть пути загруженных PDF."""
+    import app as kiosk_app
+    import search
+
+    pdf_paths = []
+    kiosk_app.create_app()
+    with kiosk_app.app.app_context():
+        kiosk_app.init_db()
+        kiosk_app.orm.session.add(kiosk_app.Organization(
+            name="Бенчмарк", logo_path="", qr_value="https://example.org/kiosk",
+        ))
+        kiosk_app.orm.session.commit()
+
+        conn = kiosk_app.get_conn()
+        body = "<p>" + "Текст страницы для нагрузочного прогона. " * 40 + "</p>"
+        conn.executemany(
+            "INSERT INTO pages(title, content, content_html) VALUES (?, ?, ?)",
+            [(f"Страница {i}", f"<h2>Раздел {i}</h2>{body}", f"<h2>Раздел {i}</h2>{body}")
+             for i in range(1, pages + 1)],
+        )
+        rows = []
+        for page_id in range(1, pages + 1):
+            for n in range(pdfs):
+                data = PDF_HEADER + rng.randbytes(pdf_kb * 1024)
+                relpath, sha, size, _ = kiosk_app.upload_store.save_bytes(data, "pdf")
+                kiosk_app._add_upload_ref(conn, relpath, sha, size)
+                rows.append((page_id, relpath, f"Документ {page_id}.{n + 1}"))
+                pdf_paths.append(relpath)
+        conn.executemany("INSERT INTO page_pdfs(page_id, file_path, title) VALUES (?, ?, ?)", rows)
+        conn.executemany(
+            "INSERT INTO buttons(title, color, page_id, position) VALUES (?, ?, ?, ?)",
+            [(f"Кнопка {i}", "#0d6efd", i % pages + 1, i) for i in range(buttons)],
+        )
+        search.rebuild(conn)
+        conn.commit()
+        conn.close()
+    return pdf_paths
+
+
+# ---------- Сервер ----------
+def serve(port):
+    """Режим дочернего процесса: приложение на 127.0.0.1:<port>."""
+    from werkzeug.serving import make_server
+
+    import app as kiosk_app
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # журнал запросов мерил бы сам себя
+    make_server("127.0.0.1", port, kiosk_app.create_app(), threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, timeout=30):
+    proc = subprocess.Popen([sys.executable, __file__, "--serve", str(port)], cwd=ROOT, env=os.environ)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"сервер завершился с кодом {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("сервер не поднялся")
+
+
+# ---------- Клиент ----------
+class Client:
+    """HTTP-клиент одного потока: свои cookie (сессия админки), без редиректов."""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            resp.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            raise
+        if resp.getheader("Connection", "").lower() == "close" or resp.version == 10:
+            self.conn.close()
+        cookie = resp.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return resp.status
+
+    def get(self, path, headers=None):
+        return self.request("GET", path, headers=headers)
+
+    def post_form(self, path, data):
+        return self.request("POST", path, urlencode(data),
+                            {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def post_json(self, path, data):
+        return self.request("POST", path, json.dumps(data), {"Content-Type": "application/json"})
+
+    def login(self):
+        self.post_form("/login", {"username": "admin", "password": "admin"})
+
+
+class Workload:
+    """Смесь запросов: имя -> (вес, функция(client, rng) -> HTTP-статус)."""
+
+    def __init__(self, db_path, pages, buttons, pdf_paths):
+        self.db_path = db_path
+        self.pages = pages
+        self.buttons = buttons
+        self.pdf_paths = pdf_paths
+        self.ops = {
+            "kiosk": (30, lambda c, r: c.get("/kiosk")),
+            "page": (30, lambda c, r: c.get(f"/page/{r.randint(1, pages)}")),
+            "uploads_pdf": (5, lambda c, r: c.get(self._pdf_url(r))),
+            "uploads_pdf_range": (10, lambda c, r: c.get(
+                self._pdf_url(r), {"Range": f"bytes=0-{RANGE_CHUNK - 1}"})),
+            "get_qr": (10, lambda c, r: c.get("/get_qr")),
+            "admin": (2, lambda c, r: c.get("/admin")),
+            "admin_page_create": (1, self._page_create),
+            "admin_page_edit": (3, self._page_edit),
+            "admin_page_delete": (1, self._page_delete),
+            "admin_button_create": (1, self._button_create),
+            "admin_button_update": (2, self._button_update),
+            "admin_button_delete": (1, self._button_delete),
+            "admin_button_reorder": (1, self._button_reorder),
+            "admin_layout": (1, self._layout),
+        }
+
+    def only(self, names):
+        unknown = set(names) - set(self.ops)
+        if unknown:
+            raise SystemExit(f"неизвестные маршруты: {', '.join(sorted(unknown))}")
+        self.ops = {name: op for name, op in self.ops.items() if name in names}
+
+    def _pdf_url(self, rng):
+        return f"/uploads/{rng.choice(self.pdf_paths)}"
+
+    def _created_id(self, table, seeded):
+        """Любая запись, созданная во время прогона (сверх наполнения), или None.
+        Смотрим в БД напрямую: маршруты создания не возвращают id."""
+        with sqlite3.connect(self.db_path, timeout=5) as db:
+            row = db.execute(f"SELECT id FROM {table} WHERE id > ? ORDER BY random() LIMIT 1", (seeded,)).fetchone()
+        return row[0] if row else None
+
+    def _page_create(self, client, rng):
+        return client.post_form("/admin/page/create", {
+            "title": f"Новая {rng.randrange(10 ** 6)}", "content": "<p>Черновик</p>" * 20,
+        })
+
+    def _page_edit(self, client, rng):
+        pid = rng.randint(1, self.pages)
+        return client.post_form(f"/admin/page/edit/{pid}", {
+            "title": f"Страница {pid}", "content": f"<h2>Раздел {pid}</h2>" + "<p>Правка.</p>" * 40,
+        })
+
+    def _page_delete(self, client, rng):
+        pid = self._created_id("pages", self.pages)
+        if pid is None:
+            return self._page_create(client, rng)
+        return client.post_form(f"/admin/page/delete/{pid}", {})
+
+    def _button_create(self, client, rng):
+        return client.post_form("/admin/button/create", {
+            "title": "Новая кнопка", "color": "#198754", "page_id": rng.randint(1, self.pages),
+        })
+
+    def _button_update(self, client, rng):
+        bid = rng.randint(1, self.buttons)
+        return client.post_form(f"/admin/button/update/{bid}", {
+            "title": f"Кнопка {bid}", "color": rng.choice(["#0d6efd", "#dc3545"]), "page_id": bid % self.pages + 1,
+        })
+
+    def _button_delete(self, client, rng):
+        bid = self._created_id("buttons", self.buttons)
+        if bid is None:
+            return self._button_create(client, rng)
+        return client.post_form(f"/admin/button/delete/{bid}", {})
+
+    def _button_reorder(self, client, rng):
+        order = list(range(1, self.buttons + 1))
+        rng.shuffle(order)
+        return client.post_json("/admin/button/reorder", [{"id": bid, "position": pos} for pos, bid in enumerate(order)])
+
+    def _layout(self, client, rng):
+        # то, что шлёт панель после перетаскивания, плюс правка названия
+        order = list(range(1, self.buttons + 1))
+        rng.shuffle(order)
+        bid = rng.choice(order)
+        return client.post_json("/admin/api/layout", {"ops": [
+            {"op": "reorder", "ids": order},
+            {"op": "retitle", "id": bid, "title": f"Кнопка {bid}"},
+        ]})
+
+
+def run(workload, port, concurrency, seconds, seed_value):
+    """Гонять смесь запросов seconds секунд; вернуть {имя: ([длительности], ошибки)}."""
+    names = list(workload.ops)
+    weights = [workload.ops[name][0] for name in names]
+    results = [{} for _ in range(concurrency)]
+    stop = threading.Event()
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        client = Client(port)
+        client.login()
+        local = results[n]
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            timings, errors = local.setdefault(name, ([], [0]))
+            t0 = time.perf_counter()
+            try:
+                status = workload.ops[name][1](client, rng)
+            except (http.client.HTTPException, OSError):
+                status = None
+            elapsed = time.perf_counter() - t0
+            if status is None or status >= 400:
+                errors[0] += 1
+            else:
+                timings.append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    merged = {}
+    for local in results:
+        for name, (timings, errors) in local.items():
+            all_timings, all_errors = merged.setdefault(name, ([], [0]))
+            all_timings.extend(timings)
+            all_errors[0] += errors[0]
+    return {name: (timings, errors[0]) for name, (timings, errors) in sorted(merged.items())}
+
+
+# ---------- Отчёт и базовая линия ----------
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(result, baseline, tolerance):
+    """Сравнение по маршрутам; регрессия — p95 выше или req/s ниже на > tolerance."""
+    out = {}
+    for name, cur in result["routes"].items():
+        base = baseline.get("routes", {}).get(name)
+        if not base or min(cur["count"], base.get("count", 0)) < MIN_SAMPLES:
+            continue
+        p95_change = cur["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps_change = cur["rps"] / base["rps"] - 1 if base.get("rps") else 0.0
+        out[name] = {
+            "p95_ms": cur["p95_ms"], "baseline_p95_ms": base["p95_ms"], "p95_change": round(p95_change, 3),
+            "rps": cur["rps"], "baseline_rps": base.get("rps"), "rps_change": round(rps_change, 3),
+            "regression": p95_change > tolerance or rps_change < -tolerance,
+        }
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--buttons", type=int, default=24)
+    parser.add_argument("--pdfs", type=int, default=2, help="PDF на страницу")
+    parser.add_argument("--pdf-kb", type=int, default=256, help="размер одного PDF, КБ")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2, help="прогрев перед замером, с")
+    parser.add_argument("--routes", help="через запятую: замерять только эти маршруты")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", nargs="?", const=str(DEFAULT_BASELINE),
+                        help=f"сравнить с базовой линией (по умолчанию {DEFAULT_BASELINE.relative_to(ROOT)})")
+    parser.add_argument("--save-baseline", action="store_true", help="записать прогон как базовую линию")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение, доля")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+    # Базовая линия не хранится в репозитории — она своя у каждой машины
+    if args.baseline and not args.save_baseline and not Path(args.baseline).exists():
+        raise SystemExit(f"нет базовой линии {args.baseline}: сначала запустите с --save-baseline")
+
+    use_temp_instance()
+    rng = random.Random(args.seed)
+    t0 = time.perf_counter()
+    pdf_paths = seed(args.pages, args.buttons, args.pdfs, args.pdf_kb, rng)
+    if not pdf_paths:
+        raise SystemExit("нужен хотя бы один PDF: --pdfs >= 1")
+    print(f"наполнение: {time.perf_counter() - t0:.1f} с", file=sys.stderr)
+
+    workload = Workload(os.environ["KIOSK_DB_PATH"], args.pages, args.buttons, pdf_paths)
+    if args.routes:
+        workload.only([name.strip() for name in args.routes.split(",") if name.strip()])
+
+    port = free_port()
+    server = start_server(port)
+    try:
+        if args.warmup:
+            run(workload, port, args.concurrency, args.warmup, args.seed + 1)
+        routes = run(workload, port, args.concurrency, args.seconds, args.seed)
+    finally:
+        server.terminate()
+        server.wait()
+
+    config = {k: getattr(args, k) for k in ("pages", "buttons", "pdfs", "pdf_kb", "concurrency", "seconds", "routes", "seed")}
+    result = {
+        "meta": {
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": config,
+        "total": summarize([t for timings, _ in routes.values() for t in timings], args.seconds,
+                           sum(errors for _, errors in routes.values())),
+        "routes": {name: summarize(timings, args.seconds, errors) for name, (timings, errors) in routes.items()},
+    }
+
+    regressions = []
+    if args.baseline and not (args.save_baseline and not Path(args.baseline).exists()):
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("config") != config:
+            print("внимание: параметры прогона отличаются от базовой линии", file=sys.stderr)
+        result["comparison"] = compare(result, baseline, args.tolerance)
+        regressions = [name for name, c in result["comparison"].items() if c["regression"]]
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.save_baseline:
+        baseline_path = Path(args.baseline or DEFAULT_BASELINE)
+        baseline_path.write_text(text + "\n", encoding="utf-8")
+        print(f"базовая линия: {baseline_path}", file=sys.stderr)
+
+    for name, route in result["routes"].items():
+        if "p95_ms" in route:
+            print(f"{name:22s} {route['rps']:8.1f} req/s  p50 {route['p50_ms']:7.2f}  p95 {route['p95_ms']:7.2f}  "
+                  f"p99 {route['p99_ms']:7.2f} мс  ошибок {route['errors']}", file=sys.stderr)
+    if regressions:
+        print(f"регрессии относительно базовой линии: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Время до первой страницы большого PDF: целиком против Range-запросов.
+
+Запуск:  python bench/pdf_range.py [--size-mb 50] [--mbit 20]
+
+Скрипт кладёт во временный каталог загрузок PDF заданного размера, поднимает
+приложение на локальном порту и сравнивает два сценария просмотрщика:
+
+  до    — сервер не объявляет Accept-Ranges, просмотрщик ждёт весь файл;
+  после — просмотрщик видит Accept-Ranges и читает хвост (xref/trailer)
+          и первые блоки, как это делает pdf.js при первом показе.
+
+Канал киоска моделируется ограничением скорости чтения на клиенте (--mbit).
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench.common import use_temp_instance  # noqa: E402
+
+use_temp_instance()
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import app as kiosk_app  # noqa: E402
+
+kiosk_app.create_app()
+
+RANGE_CHUNK = 64 * 1024   # размер блока, который pdf.js запрашивает за раз
+FIRST_PAGE_CHUNKS = 4     # блоков от начала файла для первой страницы
+
+
+def make_pdf(path, size):
+    header = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+    trailer = b"\nxref\n0 1\n0000000000 65535 f \ntrailer\n<< /Size 1 >>\nstartxref\n0\n%%EOF\n"
+    with open(path, "wb") as f:
+        f.write(header)
+        block = os.urandom(1024 * 1024)
+        left = size - len(header) - len(trailer)
+        while left > 0:
+            f.write(block[:left])
+            left -= len(block)
+        f.write(trailer)
+
+
+def fetch(url, bytes_per_sec, headers=None):
+    """Читает ответ целиком, не быстрее bytes_per_sec. Возвращает (статус, заголовки, байт)."""
+    req = urllib.request.Request(url, headers=headers or {})
+    got = 0
+    started = time.perf_counter()
+    with urllib.request.urlopen(req) as resp:
+        while True:
+            chunk = resp.read(64 * 1024)
+            if not chunk:
+                break
+            got += len(chunk)
+            lag = got / bytes_per_sec - (time.perf_counter() - started)
+            if lag > 0:
+                time.sleep(lag)
+        return resp.status, resp.headers, got
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--mbit", type=float, default=20, help="скорость канала киоска, Мбит/с")
+    parser.add_argument("--port", type=int, default=5057)
+    args = parser.parse_args()
+
+    make_pdf(kiosk_app.UPLOAD_DIR / "brochure.pdf", args.size_mb * 1024 * 1024)
+
+    server = make_server("127.0.0.1", args.port, kiosk_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{args.port}/uploads/brochure.pdf"
+    rate = args.mbit * 1_000_000 / 8
+
+    # до: весь файл одним GET
+    t0 = time.perf_counter()
+    status, _, full = fetch(url, rate)
+    before = time.perf_counter() - t0
+
+    # после: HEAD-эквивалент (первый блок), хвост с xref, затем блоки первой страницы
+    t0 = time.perf_counter()
+    status, headers, _ = fetch(url, rate, {"Range": f"bytes=0-{RANGE_CHUNK - 1}"})
+    assert status == 206 and headers.get("Accept-Ranges") == "bytes", (status, dict(headers))
+    etag = headers["ETag"]
+    total = int(headers["Content-Range"].rsplit("/", 1)[1])
+    ranged = RANGE_CHUNK
+    _, _, n = fetch(url, rate, {"Range": f"bytes={total - RANGE_CHUNK}-", "If-Range": etag})
+    ranged += n
+    for i in range(1, FIRST_PAGE_CHUNKS):
+        start = i * RANGE_CHUNK
+        _, _, n = fetch(url, rate, {"Range": f"bytes={start}-{start + RANGE_CHUNK - 1}", "If-Range": etag})
+        ranged += n
+    after = time.perf_counter() - t0
+
+    server.shutdown()
+    print(f"PDF {args.size_mb} МБ, канал {args.mbit:g} Мбит/с")
+    print(f"до (весь файл):      {before:7.2f} с, {full / 1e6:8.1f} МБ")
+    print(f"после (Range):       {after:7.2f} с, {ranged / 1e6:8.2f} МБ")
+    print(f"ускорение первой страницы: x{before / after:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Задержка поиска по мере набора на синтетической базе.
+
+Запуск:  python bench/search_fts.py [--pages 10000] [--queries 500]
+
+Создаёт временную БД с N страницами (HTML-контент, 0–3 PDF на страницу),
+строит индекс FTS5 и замеряет поиск по префиксам 1..6 букв случайных слов —
+так, как их присылает экранная клавиатура киоска. Отдельно меряется полный
+путь через маршрут /search (без кэша ответов).
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench.common import report, use_temp_instance  # noqa: E402
+
+use_temp_instance()
+
+import app as kiosk_app  # noqa: E402
+import search  # noqa: E402
+
+kiosk_app.create_app()
+
+SYLLABLES = ["ле", "сх", "оз", "бе", "ла", "пр", "ав", "ил", "до", "ку", "мен", "ты", "ра", "бо", "та",
+             "ин", "фо", "рм", "ац", "ия", "ус", "лу", "ги", "от", "де", "ле", "ние", "гра", "фик"]
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def seed(conn, pages, rng):
+    vocabulary = [word(rng) for _ in range(5000)]
+    rows = []
+    for i in range(pages):
+        title = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 5)))
+        paragraphs = "".join(
+            "<p>" + " ".join(rng.choice(vocabulary) for _ in range(rng.randint(20, 60))) + "</p>"
+            for _ in range(rng.randint(2, 6))
+        )
+        rows.append((title.capitalize(), f"<h2>{title}</h2>{paragraphs}"))
+    conn.executemany("INSERT INTO pages(title, content) VALUES (?, ?)", rows)
+    conn.executemany(
+        "INSERT INTO page_pdfs(page_id, file_path, title) VALUES (?, ?, ?)",
+        [
+            (page_id, f"doc{page_id}_{n}.pdf", " ".join(rng.choice(vocabulary) for _ in range(3)))
+            for page_id in range(1, pages + 1) for n in range(rng.randint(0, 3))
+        ],
+    )
+    return vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with kiosk_app.app.app_context():
+        kiosk_app.init_db()
+        conn = kiosk_app.get_conn()
+        vocabulary = seed(conn, args.pages, rng)
+        t0 = time.perf_counter()
+        search.rebuild(conn)
+        conn.commit()
+        print(f"страниц: {args.pages}, индекс построен за {time.perf_counter() - t0:.2f} с")
+
+        # "Набор" слова по буквам: пр, при, прил, ...
+        queries = []
+        while len(queries) < args.queries:
+            w = rng.choice(vocabulary)
+            queries.extend(w[:n] for n in range(1, min(len(w), 6) + 1))
+        queries = queries[:args.queries]
+
+        timings = []
+        for q in queries:
+            t0 = time.perf_counter()
+            search.search(conn, q)
+            timings.append(time.perf_counter() - t0)
+        report("search.search()", timings)
+
+        two_words = [f"{rng.choice(vocabulary)} {rng.choice(vocabulary)[:3]}" for _ in range(args.queries)]
+        timings = []
+        for q in two_words:
+            t0 = time.perf_counter()
+            search.search(conn, q)
+            timings.append(time.perf_counter() - t0)
+        report("search.search(), 2 слова", timings)
+        conn.close()
+
+    kiosk_app.render_cache.max_bytes = 0  # мерить сам поиск, а не кэш ответов
+    client = kiosk_app.app.test_client()
+    timings = []
+    for q in queries:
+        t0 = time.perf_counter()
+        client.get("/search", query_string={"q": q})
+        timings.append(time.perf_counter() - t0)
+    report("GET /search", timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Холодный старт: сколько стоит поднять новый процесс с приложением.
+
+Запуск:  python bench/startup.py [--runs 10] [--budget-ms 800] [--importtime]
+
+Каждый прогон — свежий интерпретатор, который делает то же, что воркер
+gunicorn без preload: `import wsgi` (импорт app.py + create_app()) и первый
+запрос к /kiosk. Отдельно меряются импорт, create_app(), первый запрос и
+полное время процесса от запуска python. С --budget-ms код выхода 1, если
+p50 импорта + create_app() превышает бюджет. --importtime печатает самые
+тяжёлые модули по `python -X importtime` (то, что стоит сделать ленивым).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench.common import ROOT, report, use_temp_instance  # noqa: E402
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app()
+t2 = time.perf_counter()
+resp = app.app.test_client().get("/kiosk")
+t3 = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2}))
+"""
+
+
+def run_child(args=()):
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, *args, "-c", CHILD], cwd=ROOT, env=os.environ,
+                         capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, out
+
+
+def heaviest_imports(limit=15):
+    """(собственное время мкс, накопленное мкс, модуль) по -X importtime."""
+    _, out = run_child(["-X", "importtime"])
+    rows = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m and len(m.group(3)) <= 3:  # только верхние уровни дерева импорта
+            rows.append((int(m.group(1)), int(m.group(2)), m.group(4)))
+    return sorted(rows, key=lambda r: r[1], reverse=True)[:limit]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--budget-ms", type=float, default=None)
+    ap.add_argument("--importtime", action="store_true")
+    args = ap.parse_args()
+
+    use_temp_instance()
+    import app as kiosk_app
+    kiosk_app.create_app()
+    with kiosk_app.app.app_context():
+        kiosk_app.init_db()
+
+    run_child()  # прогрев: .pyc и файловый кэш ОС
+    phases = {"import": [], "create_app": [], "first_request": [], "process": []}
+    for _ in range(args.runs):
+        total, out = run_child()
+        for name, seconds in json.loads(out.stdout.strip().splitlines()[-1]).items():
+            phases[name].append(seconds)
+        phases["process"].append(total)
+
+    print(f"Холодный старт, {args.runs} прогонов")
+    report("import app", phases["import"])
+    report("create_app()", phases["create_app"])
+    report("первый GET /kiosk", phases["first_request"])
+    report("процесс целиком", phases["process"])
+
+    if args.importtime:
+        print("\nСамые тяжёлые импорты (накопленное время):")
+        for _, cumulative, module in heaviest_imports():
+            print(f"  {cumulative / 1000:8.1f} мс  {module}")
+
+    if args.budget_ms is not None:
+        startup = sorted(i + c for i, c in zip(phases["import"], phases["create_app"]))
+        p50 = startup[len(startup) // 2] * 1000
+        print(f"\nimport + create_app: p50 {p50:.1f} мс, бюджет {args.budget_ms:.0f} мс")
+        if p50 > args.budget_ms:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
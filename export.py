@@ -0,0 +1,194 @@
+"""Статический экспорт киоска: /kiosk, все /page/<pid>, QR и загрузки на диск.
+
+Каталог экспорта самодостаточен и отдаётся без Python, например nginx:
+
+    root /srv/kiosk-export;
+    gzip_static on;
+    location = / { return 302 /kiosk; }
+    location / { try_files $uri $uri.html =404; }
+    location /static/ { expires max; add_header Cache-Control immutable; }
+
+Страницы рендерятся тем же приложением (через test_client), поэтому HTML
+совпадает с живым сайтом. Каждая страница экспортируется со своим
+«отпечатком» входных данных (строки БД, шаблоны, манифест статики); при
+повторной сборке перерисовываются только страницы с изменившимся
+отпечатком, а файлы копируются, только если их ещё нет или они поменялись.
+Поиск (/search) и живые обновления (/events) в экспорте не работают:
+киоск просто показывает последнюю собранную версию.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+EXPORT_FORMAT = 1
+_URL_ATTR_RE = re.compile(r"""(?:src|href|srcset|data-src)\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_CSS_URL_RE = re.compile(r"""url\(\s*["']?([^"')]+)["']?\s*\)""")
+
+
+def fingerprint(*parts):
+    """Короткий хэш от JSON-сериализуемых данных."""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:20]
+
+
+def output_path(url):
+    """/kiosk -> kiosk.html, /page/3 -> page/3.html (для try_files $uri.html)."""
+    return url.strip("/") + ".html"
+
+
+def referenced_urls(text):
+    """Локальные URL из src/href/srcset и CSS url(): только абсолютные пути."""
+    urls = set()
+    for value in _URL_ATTR_RE.findall(text) + _CSS_URL_RE.findall(text):
+        # srcset: "a.webp 320w, b.webp 640w"
+        for candidate in value.split(","):
+            candidate = candidate.strip().split(" ", 1)[0]
+            if candidate.startswith("/") and not candidate.startswith("//"):
+                urls.add(candidate.split("#", 1)[0].split("?", 1)[0])
+    return urls
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if isinstance(data, Path):
+        shutil.copyfile(data, tmp)
+    else:
+        tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class StaticExporter:
+    """Сборка каталога экспорта.
+
+    client_factory() -> Flask test_client, которым рендерятся страницы;
+    resolve(url) -> список (путь в экспорте, источник) для файла по URL, где
+    источник — Path или bytes; пустой список, если URL не экспортируется.
+    """
+
+    def __init__(self, out_dir, client_factory, resolve):
+        self.out_dir = Path(out_dir)
+        self.client_factory = client_factory
+        self.resolve = resolve
+        self._lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        self._pending = False
+        self._worker = None
+
+    @property
+    def manifest_path(self):
+        return self.out_dir / ".export.json"
+
+    def _load_manifest(self):
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {"pages": {}, "files": {}}
+        if manifest.get("format") != EXPORT_FORMAT:
+            return {"pages": {}, "files": {}}
+        return manifest
+
+    def build(self, targets, full=False):
+        """targets: {url: отпечаток}. Возвращает статистику сборки."""
+        with self._lock:
+            return self._build(targets, full)
+
+    def _build(self, targets, full):
+        started = time.perf_counter()
+        # Прошлый манифест нужен и при full: по нему удаляются пропавшие страницы и
+        # файлы; full только не даёт доверять его отпечаткам
+        old = self._load_manifest()
+        pages, files = {}, {}
+        stats = {"rendered": 0, "skipped": 0, "copied": 0, "removed": 0, "errors": []}
+        client = None
+
+        for url, fp in sorted(targets.items()):
+            out = self.out_dir / output_path(url)
+            prev = old["pages"].get(url)
+            if not full and prev and prev["fingerprint"] == fp and out.exists():
+                pages[url] = prev
+                stats["skipped"] += 1
+                continue
+            client = client or self.client_factory()
+            resp = client.get(url)
+            if resp.status_code != 200:
+                stats["errors"].append(f"{url}: HTTP {resp.status_code}")
+                if prev:
+                    pages[url] = prev  # оставляем прошлую версию
+                continue
+            body = resp.get_data()
+            _write_atomic(out, body)
+            pages[url] = {"fingerprint": fp, "refs": sorted(referenced_urls(body.decode("utf-8", "replace")))}
+            stats["rendered"] += 1
+
+        # Файлы, на которые ссылаются страницы (и CSS, на которые ссылаются они)
+        queue = sorted({ref for entry in pages.values() for ref in entry["refs"]})
+        seen = set(queue)
+        while queue:
+            url = queue.pop()
+            for dest, source in self.resolve(url):
+                signature = self._signature(source)
+                files[dest] = signature
+                target = self.out_dir / dest
+                if full or old["files"].get(dest) != signature or not target.exists():
+                    _write_atomic(target, source)
+                    stats["copied"] += 1
+                if dest.endswith(".css"):
+                    for ref in referenced_urls(target.read_text(encoding="utf-8", errors="replace")):
+                        if ref not in seen:
+                            seen.add(ref)
+                            queue.append(ref)
+
+        # Удалённые страницы и файлы, на которые больше никто не ссылается
+        stale = [output_path(url) for url in old["pages"] if url not in pages]
+        stale += [dest for dest in old["files"] if dest not in files]
+        for rel in stale:
+            try:
+                (self.out_dir / rel).unlink()
+                stats["removed"] += 1
+            except FileNotFoundError:
+                pass
+
+        manifest = {"format": EXPORT_FORMAT, "pages": pages, "files": files}
+        _write_atomic(self.manifest_path, json.dumps(manifest, indent=0, sort_keys=True).encode("utf-8"))
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+    @staticmethod
+    def _signature(source):
+        if isinstance(source, Path):
+            st = source.stat()
+            return f"{st.st_size}:{st.st_mtime_ns}"
+        return hashlib.sha256(source).hexdigest()[:20]
+
+    # ---- фоновая пересборка после правок в админке ----
+    def schedule(self, job, delay=2.0):
+        """Запустить job() в фоне через delay секунд; правки, пришедшие за
+        это время, собираются одной пересборкой."""
+        with self._schedule_lock:
+            self._pending = True
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, args=(job, delay), daemon=True,
+                                                name="static-export")
+                self._worker.start()
+
+    def _run(self, job, delay):
+        while True:
+            time.sleep(delay)
+            with self._schedule_lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                self._pending = False
+            try:
+                job()
+            except Exception:
+                log.exception("фоновая пересборка статического экспорта не удалась")
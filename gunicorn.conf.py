@@ -0,0 +1,37 @@
+"""Настройки gunicorn:  gunicorn -c gunicorn.conf.py wsgi:app
+
+preload_app: приложение импортируется и собирается (create_app) один раз в
+мастере, воркеры получают его через fork — старт и перезапуск воркера стоят
+единицы миллисекунд, а страницы памяти с кодом общие. После fork воркер
+заводит свой пул соединений SQLite (см. _after_fork в app.py).
+
+Кэши между воркерами: кэш готовых /kiosk и /page у каждого воркера свой, но
+сбрасывается общей версией контента (файл рядом с БД + таблица в ней), так
+что правка в админке видна всем воркерам сразу. QR и статика со сжатием
+лежат на диске и пишутся атомарно, манифест статики строится в мастере.
+
+Перед первым запуском и после обновления кода:  flask --app wsgi db upgrade
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("KIOSK_BIND", "0.0.0.0:8000")
+preload_app = True
+
+# gthread: открытый киоском /events (SSE) занимает поток воркера на всё время
+# соединения. Чтобы киоски не заняли все потоки и админка со страницами не
+# встали в очередь, долгих потоков SSE на воркер не больше половины threads;
+# остальные киоски получают изменения опросом раз в EVENTS_OVERFLOW_RETRY
+# сек (см. events() в app.py). Итого на сервер: workers * threads // 2
+# киосков с мгновенными обновлениями.
+worker_class = "gthread"
+workers = int(os.environ.get("KIOSK_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get("KIOSK_THREADS", 16))
+os.environ.setdefault("KIOSK_EVENTS_MAX_CLIENTS", str(max(threads // 2, 1)))
+
+# Воркеры регулярно перезапускаются (утечки памяти у Pillow/qrcode не копятся);
+# буфер статистики сбрасывается в БД при выходе воркера (atexit в app.py)
+max_requests = int(os.environ.get("KIOSK_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 20
+timeout = 60
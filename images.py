@@ -0,0 +1,100 @@
+"""Уменьшенные копии загруженных изображений (иконки плиток, логотип, картинки страниц).
+
+Оригинал остаётся как есть, а рядом в DERIVATIVES_DIR складываются WebP и JPEG
+нескольких фиксированных ширин без метаданных. Шаблоны отдают их через
+srcset, так что слабое железо киоска не качает и не декодирует фото в 5 Мп
+ради плитки 120 px.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+DERIVATIVE_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+DERIVATIVES_DIR = "_d"                       # подпапка внутри каталога загрузок
+RASTER_EXT = {"png", "jpg", "jpeg", "gif"}   # svg и pdf не трогаем
+
+
+def is_raster(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in RASTER_EXT
+
+
+def derivative_name(filename, width, fmt):
+    ext = "jpg" if fmt == "jpeg" else fmt
+    return f"{DERIVATIVES_DIR}/{filename}-{width}.{ext}"
+
+
+class ImagePipeline:
+    """Фоновый пул, который строит производные изображения.
+
+    on_done(filename, items) вызывается из рабочего потока после успешной
+    сборки; items — список (width, fmt, path, size_bytes).
+    """
+
+    def __init__(self, upload_dir, workers=2, on_done=None):
+        self.upload_dir = Path(upload_dir)
+        self.on_done = on_done
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="derivatives")
+
+    def submit(self, filename):
+        if filename and is_raster(filename):
+            return self._pool.submit(self._run, filename)
+        return None
+
+    def _run(self, filename):
+        items = self.build(filename)
+        if items and self.on_done is not None:
+            self.on_done(filename, items)
+        return items
+
+    def build(self, filename):
+        # Pillow нужен только рабочему потоку — импорт не замедляет старт приложения
+        from PIL import Image, ImageOps
+
+        src = self.upload_dir / filename
+        try:
+            with Image.open(src) as im:
+                im.seek(0)  # у анимированного GIF берём первый кадр
+                im = ImageOps.exif_transpose(im)
+                has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+                im = im.convert("RGBA" if has_alpha else "RGB")
+                flat = im
+                if has_alpha:
+                    flat = Image.new("RGB", im.size, (255, 255, 255))
+                    flat.paste(im, mask=im.getchannel("A"))
+
+                # Ширины больше оригинала не делаем, но хотя бы одна копия нужна
+                widths = [w for w in DERIVATIVE_WIDTHS if w < im.width] or [im.width]
+                if im.width < DERIVATIVE_WIDTHS[-1] and im.width not in widths:
+                    widths.append(im.width)
+
+                items = []
+                for width in widths:
+                    height = max(1, round(im.height * width / im.width))
+                    for fmt, pil_format in DERIVATIVE_FORMATS.items():
+                        base = im if fmt == "webp" else flat
+                        resized = base if width == base.width else base.resize((width, height), Image.LANCZOS)
+                        rel = derivative_name(filename, width, fmt)
+                        dst = self.upload_dir / rel
+                        dst.parent.mkdir(parents=True, exist_ok=True)
+                        tmp = dst.with_name(dst.name + ".tmp")
+                        # exif/icc не передаём — метаданные отрезаются
+                        if fmt == "webp":
+                            resized.save(tmp, pil_format, quality=80, method=4)
+                        else:
+                            resized.save(tmp, pil_format, quality=82, optimize=True, progressive=True)
+                        os.replace(tmp, dst)
+                        items.append((width, fmt, rel, dst.stat().st_size))
+                return items
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return []
+
+    def remove(self, paths):
+        for rel in paths:
+            try:
+                os.remove(self.upload_dir / rel)
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
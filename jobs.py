@@ -0,0 +1,95 @@
+"""Фоновые задачи админки (импорт контента) с прогрессом.
+
+Задача выполняется в потоке того процесса, который её принял, а состояние
+пишется в файл instance/jobs/<id>.json — так прогресс виден из любого
+воркера gunicorn, и запись не конкурирует с транзакцией самой задачи за
+блокировку SQLite.
+"""
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{16}$")
+PROGRESS_INTERVAL = 0.25  # сек: чаще прогресс на диск не пишется
+
+
+class Job:
+    def __init__(self, jobs, job_id, kind):
+        self.jobs = jobs
+        self.id = job_id
+        self.state = {"id": job_id, "kind": kind, "state": "running", "stage": "", "done": 0, "total": 0,
+                      "result": None, "error": None, "pid": os.getpid(), "started_at": time.time()}
+        self._written = 0.0
+
+    def update(self, force=False, **fields):
+        """Обновить прогресс (stage, done, total, ...); на диск — не чаще PROGRESS_INTERVAL."""
+        self.state.update(fields)
+        now = time.time()
+        if force or now - self._written >= PROGRESS_INTERVAL:
+            self._written = now
+            self.state["updated_at"] = now
+            self.jobs._write(self.id, self.state)
+
+
+class Jobs:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, job_id):
+        return self.root / f"{job_id}.json"
+
+    def _write(self, job_id, state):
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(job_id)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def new_id(self):
+        return secrets.token_hex(8)
+
+    def start(self, kind, target, job_id=None):
+        """Запустить target(job) в фоне; вернуть id задачи. Результат target
+        попадает в result, исключение — в error."""
+        job = Job(self, job_id or self.new_id(), kind)
+        job.update(force=True)
+
+        def run():
+            try:
+                result = target(job)
+            except Exception as e:
+                log.exception("фоновая задача %s (%s) не удалась", job.id, kind)
+                job.update(force=True, state="failed", error=str(e) or e.__class__.__name__)
+            else:
+                job.update(force=True, state="done", result=result)
+
+        threading.Thread(target=run, daemon=True, name=f"job-{kind}").start()
+        return job.id
+
+    def get(self, job_id):
+        if not _JOB_ID_RE.match(job_id):
+            return None
+        try:
+            state = json.loads(self._path(job_id).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        if state["state"] == "running" and not _alive(state["pid"]):
+            state.update(state="failed", error="процесс, выполнявший задачу, завершился")
+        return state
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
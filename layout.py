@@ -0,0 +1,102 @@
+"""Пакетные правки раскладки киоска: порядок плиток, перемещение, названия.
+
+Админка присылает список операций, и весь список применяется одной
+транзакцией: сначала в памяти, поверх текущего порядка кнопок, затем в БД —
+по одному executemany на вид изменения и только для строк, которые
+действительно поменялись. Ошибка в любой операции отменяет весь пакет.
+
+    {"op": "reorder", "ids": [3, 1, 2]}              эти кнопки — в начало, в этом порядке
+    {"op": "move", "id": 5, "to": 0}                 кнопку на позицию to (с нуля)
+    {"op": "retitle", "id": 5, "title": "..."}       переименовать кнопку
+    {"op": "retitle", "page_id": 7, "title": "..."}  переименовать страницу
+"""
+MAX_OPS = 1000
+
+
+class LayoutError(Exception):
+    pass
+
+
+def _int(op, key):
+    value = op.get(key)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise LayoutError(f"{op.get('op')}: {key} должен быть целым числом")
+    return value
+
+
+def _title(op):
+    title = op.get("title")
+    if not isinstance(title, str) or not title.strip():
+        raise LayoutError("retitle: пустое название")
+    return title.strip()
+
+
+def apply_ops(conn, ops):
+    """Применить ops; транзакцию открывает здесь, коммитит вызывающий. Возвращает
+    {"positions": n, "buttons": n, "pages": [id, ...]}; страницы с новым
+    заголовком вызывающий переиндексирует в поиске."""
+    if not isinstance(ops, list) or not ops:
+        raise LayoutError("нужен непустой список операций")
+    if len(ops) > MAX_OPS:
+        raise LayoutError(f"не больше {MAX_OPS} операций за раз")
+
+    # Блокировка записи до чтения порядка: параллельный пакет подождёт и
+    # применится поверх нашего, а не поверх прочитанного одновременно с нами
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute("SELECT id, position FROM buttons ORDER BY position, id").fetchall()
+    order = [row["id"] for row in rows]
+    known = set(order)
+    reordered = False
+    button_titles, page_titles = {}, {}
+
+    for op in ops:
+        if not isinstance(op, dict):
+            raise LayoutError("операция должна быть объектом")
+        kind = op.get("op")
+        if kind == "reorder":
+            ids = op.get("ids")
+            if (not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+                    or len(set(ids)) != len(ids)):
+                raise LayoutError("reorder: ids — список целых без повторов")
+            missing = [i for i in ids if i not in known]
+            if missing:
+                raise LayoutError(f"reorder: нет кнопок {missing}")
+            listed = set(ids)
+            order = ids + [i for i in order if i not in listed]
+            reordered = True
+        elif kind == "move":
+            button_id, to = _int(op, "id"), _int(op, "to")
+            if button_id not in known:
+                raise LayoutError(f"move: нет кнопки {button_id}")
+            order.remove(button_id)
+            order.insert(max(0, min(to, len(order))), button_id)
+            reordered = True
+        elif kind == "retitle":
+            if "page_id" in op:
+                page_titles[_int(op, "page_id")] = _title(op)
+            else:
+                button_id = _int(op, "id")
+                if button_id not in known:
+                    raise LayoutError(f"retitle: нет кнопки {button_id}")
+                button_titles[button_id] = _title(op)
+        else:
+            raise LayoutError(f"неизвестная операция: {kind!r}")
+
+    if page_titles:
+        placeholders = ", ".join("?" * len(page_titles))
+        found = {row[0] for row in conn.execute(f"SELECT id FROM pages WHERE id IN ({placeholders})",
+                                                list(page_titles))}
+        missing = sorted(set(page_titles) - found)
+        if missing:
+            raise LayoutError(f"retitle: нет страниц {missing}")
+
+    positions = []
+    if reordered:
+        current = {row["id"]: row["position"] for row in rows}
+        positions = [(index, button_id) for index, button_id in enumerate(order) if current[button_id] != index]
+        conn.executemany("UPDATE buttons SET position=? WHERE id=?", positions)
+    conn.executemany("UPDATE buttons SET title=? WHERE id=?",
+                     [(title, button_id) for button_id, title in button_titles.items()])
+    conn.executemany("UPDATE pages SET title=? WHERE id=?",
+                     [(title, page_id) for page_id, title in page_titles.items()])
+    return {"positions": len(positions), "buttons": len(button_titles), "pages": sorted(page_titles)}
@@ -0,0 +1,237 @@
+"""Метрики процесса в текстовом формате Prometheus (/metrics).
+
+Что считается:
+  - запросы: число по (метод, endpoint, статус) и длительность по endpoint;
+  - SQL: число и длительность запросов. Замер стоит в фабрике соединений
+    sqlite3, поэтому видны и get_conn(), и ORM (у них общий пул); запросы
+    ORM помечаются source="orm" по событиям движка SQLAlchemy;
+  - рендер шаблонов Jinja по имени шаблона;
+  - байты, отданные из /uploads.
+
+Счётчики живут в памяти процесса: при нескольких воркерах gunicorn каждый
+отдаёт свои, и Prometheus складывает их по instance.
+"""
+import bisect
+import contextvars
+import sqlite3
+import threading
+import time
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+TEMPLATE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SLOW_QUERY_TEXT = 300  # столько символов SQL попадает в журнал медленных запросов
+
+_request = contextvars.ContextVar("metrics_request", default=None)
+_source = contextvars.ContextVar("metrics_sql_source", default="raw")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [счётчики по корзинам..., сумма, число]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, ('le', _number(bound)))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.label_names, labels, ('le', '+Inf'))} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}"
+
+
+class RequestStats:
+    """Что набралось за один HTTP-запрос (для гистограмм и журнала медленных)."""
+
+    def __init__(self, keep_queries):
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.token = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.queries = [] if keep_queries else None
+        self.templates = [] if keep_queries else None
+
+
+class _TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            self.connection.metrics.observe_sql(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            self.connection.metrics.observe_sql(sql, time.perf_counter() - t0)
+
+
+class _TimedConnection(sqlite3.Connection):
+    metrics = None
+
+    # Connection.execute() тоже создаёт курсор через self.cursor()
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+
+class Metrics:
+    def __init__(self, slow_request_ms=None):
+        self.slow_request_ms = slow_request_ms
+        self.requests = Counter("kiosk_http_requests_total", "HTTP requests", ("method", "endpoint", "status"))
+        self.request_seconds = Histogram(
+            "kiosk_http_request_duration_seconds", "Request handling time", ("endpoint",))
+        self.request_queries = Histogram(
+            "kiosk_http_request_sql_queries", "SQL queries per request", ("endpoint",), QUERY_COUNT_BUCKETS)
+        self.sql_queries = Counter("kiosk_sql_queries_total", "SQL statements executed", ("source",))
+        self.sql_seconds = Histogram("kiosk_sql_query_duration_seconds", "SQL statement time", ("source",), SQL_BUCKETS)
+        self.template_seconds = Histogram(
+            "kiosk_template_render_seconds", "Jinja template render time", ("template",), TEMPLATE_BUCKETS)
+        self.upload_bytes = Counter("kiosk_upload_bytes_total", "Bytes sent from /uploads", ("status",))
+        self._all = [self.requests, self.request_seconds, self.request_queries, self.sql_queries,
+                     self.sql_seconds, self.template_seconds, self.upload_bytes]
+        self._templates = threading.local()
+        self.connection_factory = type("TimedConnection", (_TimedConnection,), {"metrics": self})
+
+    # ---- SQL ----
+    def observe_sql(self, sql, seconds):
+        source = _source.get()
+        self.sql_queries.inc(1, source)
+        self.sql_seconds.observe(seconds, source)
+        stats = _request.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += seconds
+            if stats.queries is not None:
+                stats.queries.append((source, seconds, " ".join(sql.split())[:SLOW_QUERY_TEXT]))
+
+    def track_engine(self, engine):
+        """Пометить запросы, которые идут через SQLAlchemy, как source="orm"."""
+        from sqlalchemy import event
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metrics_tokens", []).append(_source.set("orm"))
+
+        def after(conn, *args):
+            tokens = conn.info.get("metrics_tokens")
+            if tokens:
+                _source.reset(tokens.pop())
+
+        def on_error(context):
+            if context.connection is not None:
+                after(context.connection)
+
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+        event.listen(engine, "handle_error", on_error)
+
+    # ---- запросы ----
+    def start_request(self):
+        stats = RequestStats(keep_queries=self.slow_request_ms is not None)
+        # reset(), а не set(None) в конце: запрос может быть вложенным (test_client внутри view)
+        stats.token = _request.set(stats)
+
+    def finish_request(self, method, endpoint, status):
+        """Записать запрос; вернуть RequestStats, если он медленный (иначе None)."""
+        stats = _request.get()
+        if stats is None:
+            return None
+        _request.reset(stats.token)
+        seconds = time.perf_counter() - stats.started
+        endpoint = endpoint or "unknown"
+        self.requests.inc(1, method, endpoint, str(status))
+        self.request_seconds.observe(seconds, endpoint)
+        self.request_queries.observe(stats.sql_count, endpoint)
+        stats.seconds = seconds
+        if self.slow_request_ms is not None and seconds * 1000 >= self.slow_request_ms:
+            return stats
+        return None
+
+    # ---- шаблоны ----
+    def template_started(self):
+        stack = getattr(self._templates, "stack", None)
+        if stack is None:
+            stack = self._templates.stack = []
+        stack.append(time.perf_counter())
+
+    def template_finished(self, name):
+        stack = getattr(self._templates, "stack", None)
+        if not stack:
+            return
+        seconds = time.perf_counter() - stack.pop()
+        self.template_seconds.observe(seconds, name or "<string>")
+        stats = _request.get()
+        if stats is not None and stats.templates is not None:
+            stats.templates.append((name, seconds))
+
+    def render(self):
+        lines = []
+        for metric in self._all:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+def format_slow_request(method, path, status, stats):
+    lines = [f"{method} {path} -> {status}: {stats.seconds * 1000:.1f} мс, "
+             f"SQL: {stats.sql_count} за {stats.sql_seconds * 1000:.1f} мс"]
+    lines.extend(f"  {source:3s} {seconds * 1000:7.2f} мс  {sql}" for source, seconds, sql in stats.queries)
+    lines.extend(f"  tpl {seconds * 1000:7.2f} мс  {name}" for name, seconds in stats.templates)
+    return "\n".join(lines)
@@ -0,0 +1,209 @@
+"""initial schema
+
+Схема, которую раньше создавали init_db() и orm.create_all() при старте.
+Все операторы идемпотентны, так что `flask db upgrade` на существующей
+database.db просто отмечает её как находящуюся на этой ревизии.
+
+Revision ID: 3f1c0a9d2b7e
+Revises:
+Create Date: 2026-10-17 09:00:00
+
+"""
+from html.parser import HTMLParser
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3f1c0a9d2b7e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TABLES = (
+    """CREATE TABLE IF NOT EXISTS pages(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT,
+        image_path TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS page_pdfs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_id INTEGER NOT NULL,
+        file_path TEXT NOT NULL,
+        title TEXT NOT NULL,
+        FOREIGN KEY(page_id) REFERENCES pages(id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS users(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS buttons(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        color TEXT,
+        page_id INTEGER,
+        icon_path TEXT,
+        position INTEGER DEFAULT 0,
+        FOREIGN KEY(page_id) REFERENCES pages(id)
+    )""",
+    # Таблица модели Organization (app.py)
+    """CREATE TABLE IF NOT EXISTS organization(
+        id INTEGER NOT NULL PRIMARY KEY,
+        name VARCHAR(100),
+        logo_path VARCHAR(200),
+        qr_value VARCHAR(500)
+    )""",
+    # Версия контента для кэша рендера (одна строка)
+    """CREATE TABLE IF NOT EXISTS content_version(
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    )""",
+    # События об изменениях для SSE (id = Last-Event-ID)
+    """CREATE TABLE IF NOT EXISTS change_events(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT,
+        created_at REAL NOT NULL
+    )""",
+    # Уменьшенные копии загруженных изображений (см. images.py)
+    """CREATE TABLE IF NOT EXISTS image_derivatives(
+        source TEXT NOT NULL,
+        width INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        path TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        PRIMARY KEY(source, width, format)
+    )""",
+    # Счётчики ссылок на файлы в хранилище загрузок (см. storage.py)
+    """CREATE TABLE IF NOT EXISTS upload_refs(
+        path TEXT PRIMARY KEY,
+        sha256 TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0
+    )""",
+)
+
+# Статистика киосков (см. analytics.py)
+ANALYTICS = (
+    """CREATE TABLE IF NOT EXISTS analytics_events(
+        id INTEGER PRIMARY KEY,
+        kiosk TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        target INTEGER NOT NULL,
+        ts REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_analytics_events_ts ON analytics_events(ts)",
+    # hour — начало часа (unix time), day — дата по времени сервера
+    """CREATE TABLE IF NOT EXISTS analytics_hourly(
+        kiosk TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        target INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY(hour, kiosk, kind, target)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS analytics_daily(
+        kiosk TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        target INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY(day, kiosk, kind, target)
+    ) WITHOUT ROWID""",
+)
+
+# Полнотекстовый индекс страниц (см. search.py)
+PAGES_FTS = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+        title, body, pdfs,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+"""
+
+INDEXES = (
+    # Списки админки и выборки по странице
+    "CREATE INDEX IF NOT EXISTS idx_page_pdfs_page_id ON page_pdfs(page_id)",
+    "CREATE INDEX IF NOT EXISTS idx_buttons_position ON buttons(position, id)",
+    "CREATE INDEX IF NOT EXISTS idx_pages_title ON pages(title, id)",
+)
+
+
+def upgrade():
+    for statement in TABLES:
+        op.execute(statement)
+
+    # Готовый к показу HTML страницы (см. page_content.py); в старых БД колонки нет
+    bind = op.get_bind()
+    page_columns = {row[1] for row in bind.exec_driver_sql("PRAGMA table_info(pages)")}
+    if "content_html" not in page_columns:
+        op.execute("ALTER TABLE pages ADD COLUMN content_html TEXT")
+
+    for statement in INDEXES:
+        op.execute(statement)
+
+    op.execute("INSERT OR IGNORE INTO users(username, password) VALUES('admin', 'admin')")
+    op.execute("INSERT OR IGNORE INTO content_version(id, version) VALUES (1, 0)")
+
+    for statement in ANALYTICS:
+        op.execute(statement)
+
+    # Полнотекстовый индекс: если его ещё не было — заполнить по текущим страницам
+    fts_exists = bind.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name='pages_fts'").fetchone()
+    op.execute(PAGES_FTS)
+    if not fts_exists:
+        _fill_pages_fts(bind)
+
+
+class _TextExtractor(HTMLParser):
+    # Копия search._TextExtractor на момент этой ревизии: миграции не зависят от кода приложения
+    SKIP = {"script", "style"}
+    BLOCK = {"p", "div", "br", "li", "tr", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BLOCK:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def _html_to_text(html):
+    if not html:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return " ".join("".join(parser.parts).split())
+
+
+def _fill_pages_fts(bind):
+    pdfs = {}
+    for page_id, title in bind.exec_driver_sql("SELECT page_id, title FROM page_pdfs ORDER BY id"):
+        pdfs.setdefault(page_id, []).append(title)
+    rows = [
+        (page_id, title or "", _html_to_text(content), " ".join(pdfs.get(page_id, ())))
+        for page_id, title, content in bind.exec_driver_sql("SELECT id, title, content FROM pages").fetchall()
+    ]
+    if rows:
+        bind.exec_driver_sql("INSERT INTO pages_fts(rowid, title, body, pdfs) VALUES (?, ?, ?, ?)", rows)
+
+
+def downgrade():
+    for name in ("pages_fts", "analytics_daily", "analytics_hourly", "analytics_events", "upload_refs",
+                 "image_derivatives", "change_events", "content_version", "organization", "buttons",
+                 "users", "page_pdfs", "pages"):
+        op.execute(f"DROP TABLE IF EXISTS {name}")
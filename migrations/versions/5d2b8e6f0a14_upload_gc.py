@@ -0,0 +1,48 @@
+"""upload gc
+
+Пометки неиспользуемых загрузок и журнал прогонов сборщика (см. upload_gc.py).
+
+Revision ID: 5d2b8e6f0a14
+Revises: 8c4e2f7a1d35
+Create Date: 2026-10-17 15:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5d2b8e6f0a14'
+down_revision = '8c4e2f7a1d35'
+branch_labels = None
+depends_on = None
+
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS upload_orphans(
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        seen_at REAL NOT NULL
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS upload_gc_runs(
+        id INTEGER PRIMARY KEY,
+        started_at REAL NOT NULL,
+        finished_at REAL,
+        deleted_files INTEGER NOT NULL DEFAULT 0,
+        deleted_bytes INTEGER NOT NULL DEFAULT 0,
+        pending_files INTEGER NOT NULL DEFAULT 0,
+        pending_bytes INTEGER NOT NULL DEFAULT 0,
+        fixed_refs INTEGER NOT NULL DEFAULT 0,
+        missing_files INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_upload_gc_runs_started ON upload_gc_runs(started_at)",
+)
+
+
+def upgrade():
+    for statement in SCHEMA:
+        op.execute(statement)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS upload_gc_runs")
+    op.execute("DROP TABLE IF EXISTS upload_orphans")
@@ -0,0 +1,45 @@
+"""upload sessions
+
+Сессии загрузки файлов частями (см. resumable.py).
+
+Revision ID: 8c4e2f7a1d35
+Revises: 3f1c0a9d2b7e
+Create Date: 2026-10-17 12:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2f7a1d35'
+down_revision = '3f1c0a9d2b7e'
+branch_labels = None
+depends_on = None
+
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS upload_sessions(
+        id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        chunk_size INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'open',
+        file_path TEXT,
+        updated_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions(updated_at)",
+    """CREATE TABLE IF NOT EXISTS upload_chunks(
+        session_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        PRIMARY KEY(session_id, idx)
+    ) WITHOUT ROWID""",
+)
+
+
+def upgrade():
+    for statement in SCHEMA:
+        op.execute(statement)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS upload_chunks")
+    op.execute("DROP TABLE IF EXISTS upload_sessions")
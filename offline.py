@@ -0,0 +1,165 @@
+"""Манифест офлайн-режима киоска (его читает service worker static/js/sw.js).
+
+Манифест — версия (контента и сборки) и список всего, что нужно киоску без
+сети: /kiosk, каждая /page/<pid> и все файлы, на которые они ссылаются
+(статика, картинки с уменьшенными копиями, PDF, QR), у каждой записи — хэш.
+Клиент сравнивает хэши с прошлым манифестом и скачивает только изменившееся.
+
+Список файлов страницы берётся из её HTML, поэтому страница рендерится —
+но только когда меняется её отпечаток (см. app._export_targets). На тысячах
+страниц это секунды, поэтому манифест собирается не в запросе, а в фоне,
+один раз на версию на весь сервер: готовый манифест и ссылки страниц лежат
+в instance/offline/ и читаются любым воркером, а собирает тот процесс,
+который взял файл-блокировку. Пока манифеста текущей версии нет, запрос
+получает 503 с Retry-After.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from export import referenced_urls
+
+log = logging.getLogger(__name__)
+
+LOCK_STALE = 30 * 60  # сек: блокировка упавшего процесса считается брошенной
+
+
+class OfflineManifest:
+    """root — каталог с готовыми манифестами; client_factory() -> Flask
+    test_client; file_hash(url) -> хэш файла или None, если URL не файл
+    (ссылка на другую страницу и т.п.)."""
+
+    def __init__(self, root, client_factory, file_hash):
+        self.root = Path(root)
+        self.client_factory = client_factory
+        self.file_hash = file_hash
+        self._lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        self._pending = False
+        self._worker = None
+
+    def path(self, version):
+        return self.root / f"manifest-{version}.json"
+
+    @property
+    def refs_path(self):
+        return self.root / "refs.json"
+
+    @property
+    def lock_path(self):
+        return self.root / ".lock"
+
+    def load(self, version):
+        """Готовый манифест версии или None."""
+        try:
+            return json.loads(self.path(version).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def ensure(self, version, targets_factory):
+        """Собрать манифест version, если его ещё нет. targets_factory() ->
+        {url страницы: отпечаток}. False — собирает другой процесс."""
+        if self.path(version).exists():
+            return True
+        if not self._acquire():
+            return False
+        try:
+            with self._lock:
+                if not self.path(version).exists():
+                    self._build(version, targets_factory())
+        finally:
+            self.lock_path.unlink(missing_ok=True)
+        return True
+
+    def _acquire(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - self.lock_path.stat().st_mtime < LOCK_STALE:
+                        return False
+                    self.lock_path.unlink()
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _load_refs(self):
+        try:
+            return {url: (fp, refs) for url, (fp, refs) in
+                    json.loads(self.refs_path.read_text(encoding="utf-8")).items()}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _build(self, version, targets):
+        started = time.perf_counter()
+        old_refs = self._load_refs()
+        refs, entries = {}, {}
+        rendered = 0
+        client = None
+        for url, fp in sorted(targets.items()):
+            cached = old_refs.get(url)
+            if cached is None or cached[0] != fp:
+                client = client or self.client_factory()
+                resp = client.get(url)
+                if resp.status_code != 200:
+                    continue
+                cached = (fp, sorted(referenced_urls(resp.get_data(as_text=True))))
+                rendered += 1
+            refs[url] = cached
+            entries[url] = fp
+            for ref in cached[1]:
+                if ref not in entries and ref not in targets:
+                    file_hash = self.file_hash(ref)
+                    if file_hash:
+                        entries[ref] = file_hash
+        manifest = {
+            "version": version,
+            "entries": [{"url": url, "hash": file_hash} for url, file_hash in sorted(entries.items())],
+        }
+        self._write(self.refs_path, refs)
+        self._write(self.path(version), manifest)
+        for path in self.root.glob("manifest-*.json"):
+            if path != self.path(version):
+                path.unlink(missing_ok=True)
+        log.info("манифест офлайн-режима %s: %d записей, отрисовано страниц %d за %.2f с",
+                 version, len(entries), rendered, time.perf_counter() - started)
+        return manifest
+
+    @staticmethod
+    def _write(path, data):
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    # ---- фоновая сборка ----
+    def schedule(self, job, delay=1.0):
+        """Запустить job() в фоне через delay секунд; запросы, пришедшие за
+        это время, собираются одной сборкой."""
+        with self._schedule_lock:
+            self._pending = True
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, args=(job, delay), daemon=True,
+                                                name="offline-manifest")
+                self._worker.start()
+
+    def _run(self, job, delay):
+        while True:
+            time.sleep(delay)
+            with self._schedule_lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                self._pending = False
+            try:
+                job()
+            except Exception:
+                log.exception("сборка манифеста офлайн-режима не удалась")
@@ -0,0 +1,78 @@
+"""Обработка HTML страниц из TinyMCE при сохранении.
+
+TinyMCE может сохранить вставленную картинку прямо в HTML как data:-URI, и
+тогда pages.content разрастается до мегабайт. Такие картинки выносятся в
+хранилище загрузок, а для показа на киоске готовится отдельная версия HTML:
+у <img> проставлены loading="lazy", decoding="async" и размеры, чтобы
+страница не прыгала при подгрузке.
+"""
+import base64
+import binascii
+import re
+
+_IMG_RE = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+_ATTR_RE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+_DATA_URI_RE = re.compile(r"^data:image/(png|jpe?g|gif|webp);base64,(.*)$", re.IGNORECASE | re.DOTALL)
+DATA_EXT = {"png": "png", "jpeg": "jpg", "jpg": "jpg", "gif": "gif", "webp": "webp"}
+
+
+def _attrs(tag):
+    return {m.group(1).lower(): next(v for v in m.groups()[1:] if v is not None) for m in _ATTR_RE.finditer(tag)}
+
+
+def _add_attrs(tag, extra):
+    if not extra:
+        return tag
+    tail = "/>" if tag.endswith("/>") else ">"
+    added = "".join(f' {name}="{value}"' for name, value in extra.items())
+    return tag[: -len(tail)].rstrip() + added + (" />" if tail == "/>" else ">")
+
+
+def extract_inline_images(html, save):
+    """Заменяет src="data:image/...;base64,..." на URL файла.
+
+    save(data: bytes, ext: str) -> url сохраняет картинку (с дедупликацией
+    на стороне хранилища). Битые data:-URI оставляются как есть.
+    """
+    if not html or "data:image" not in html:
+        return html
+
+    def replace(match):
+        tag = match.group(0)
+        src = _attrs(tag).get("src", "")
+        m = _DATA_URI_RE.match(src.strip())
+        if not m:
+            return tag
+        try:
+            data = base64.b64decode(re.sub(r"\s+", "", m.group(2)), validate=True)
+        except (binascii.Error, ValueError):
+            return tag
+        url = save(data, DATA_EXT[m.group(1).lower()])
+        return tag.replace(src, url, 1)
+
+    return _IMG_RE.sub(replace, html)
+
+
+def render_html(html, image_size):
+    """Версия HTML для показа: lazy-загрузка и размеры у всех <img>.
+
+    image_size(src) -> (width, height) или None, если размер не узнать.
+    """
+    if not html:
+        return html or ""
+
+    def replace(match):
+        tag = match.group(0)
+        attrs = _attrs(tag)
+        extra = {}
+        if "loading" not in attrs:
+            extra["loading"] = "lazy"
+        if "decoding" not in attrs:
+            extra["decoding"] = "async"
+        if "width" not in attrs and "height" not in attrs:
+            size = image_size(attrs.get("src", ""))
+            if size:
+                extra["width"], extra["height"] = size
+        return _add_attrs(tag, extra)
+
+    return _IMG_RE.sub(replace, html)
@@ -0,0 +1,101 @@
+"""QR-код организации: рендер на сервере с кэшем в памяти и на диске.
+
+Картинка адресуется ключом — хэшем от (размер, значение), поэтому URL
+/qr/<ключ>.png|svg никогда не меняет содержимое и кэшируется навсегда,
+а киоску не нужно ни спрашивать /get_qr, ни кодировать QR в JavaScript.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+QR_BORDER = 2
+
+
+def qr_key(value, size):
+    return hashlib.sha256(f"{size}:{value}".encode("utf-8")).hexdigest()[:32]
+
+
+def render_qr(value, size, fmt):
+    # qrcode тянет за собой PIL и свои модули — импортируем только при рендере
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(border=QR_BORDER, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(value)
+    qr.make(fit=True)
+    modules = qr.modules_count + 2 * QR_BORDER
+    buf = io.BytesIO()
+    if fmt == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buf)
+    else:
+        from PIL import Image
+
+        qr.box_size = max(1, size // modules)
+        img = qr.make_image().get_image().convert("1")
+        if img.size != (size, size):
+            img = img.resize((size, size), Image.NEAREST)
+        img.save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+class QrCache:
+    """LRU в памяти поверх каталога на диске (общего для всех воркеров).
+
+    На диске хранится не больше max_files картинок: при записи новой самые
+    старые удаляются. Вытесненную картинку текущего QR организации /qr/
+    просто нарисует заново.
+    """
+
+    def __init__(self, cache_dir, max_entries=32, max_files=256):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, fmt, value=None, size=None):
+        """Байты картинки по ключу. value/size нужны, только если картинки
+        ещё нет ни в памяти, ни на диске; без них вернётся None."""
+        with self._lock:
+            data = self._entries.get((key, fmt))
+            if data is not None:
+                self._entries.move_to_end((key, fmt))
+                return data
+
+        path = self.cache_dir / f"{key}.{fmt}"
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            if value is None:
+                return None
+            data = render_qr(value, size, fmt)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            self._trim_disk()
+
+        with self._lock:
+            self._entries[(key, fmt)] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def _trim_disk(self):
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(tuple(f".{fmt}" for fmt in QR_FORMATS)):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,195 @@
+"""Кэш отрендеренных страниц киоска, привязанный к версии контента.
+
+Версия контента — счётчик в таблице content_version, который увеличивается
+при каждой записи из админки. Текущее значение дублируется в маленький файл,
+поэтому проверка версии на каждый запрос — это один stat() без обращения к БД,
+а все воркеры (процессы) видят инвалидацию одновременно. Файл каждый раз
+заменяется целиком (os.replace), так что у новой версии новый inode — по нему
+изменение видно даже там, где mtime грубый и две записи попадают в один тик.
+
+Файл — лишь копия счётчика из БД и лежит рядом с ней. При первом обращении
+процесс сверяет их: если БД восстановили из старой копии и её счётчик
+меньше файла, счётчик продолжается после значения из файла — иначе версия
+вернулась бы к уже выданному номеру с другим контентом (ложные 304).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+
+
+class ContentVersion:
+    """Номер версии контента, общий для всех процессов."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None   # (st_ino, st_mtime_ns) прочитанного файла
+        self._value = 0
+        self._synced = False
+
+    def current(self, conn_factory=None):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if conn_factory is not None and (st is None or not self._synced):
+            # Первое обращение в процессе или файла нет — сверить с БД
+            conn = conn_factory()
+            try:
+                self.sync(conn)
+            finally:
+                conn.close()
+            return self.current()
+        if st is None:
+            return self._value
+        stamp = (st.st_ino, st.st_mtime_ns)
+        if stamp != self._stamp:
+            with self._lock:
+                value = self._read()
+                if value is None:
+                    return self._value
+                self._value, self._stamp = value, stamp
+        return self._value
+
+    def sync(self, conn):
+        """Свести файл и счётчик в БД: берётся большее, а если больше файл —
+        счётчик в БД продолжается после него."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO content_version(id, version) VALUES (1, 0)")
+            version = conn.execute("SELECT version FROM content_version WHERE id=1").fetchone()[0]
+            stored = self._read()
+            if stored is not None and stored > version:
+                version = stored + 1
+                conn.execute("UPDATE content_version SET version=? WHERE id=1", (version,))
+            if stored != version:
+                self._write(version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        self._synced = True
+        return version
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="ascii") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def bump(self, conn, record=None):
+        """Увеличивает версию. Файл пишется под write-lock БД, поэтому
+        конкурирующие процессы не могут записать версии не по порядку.
+
+        record(conn, version) выполняется в той же транзакции — например,
+        чтобы записать событие об изменении.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO content_version(id, version) VALUES (1, 0)")
+            conn.execute("UPDATE content_version SET version = version + 1 WHERE id=1")
+            version = conn.execute("SELECT version FROM content_version WHERE id=1").fetchone()[0]
+            if record is not None:
+                record(conn, version)
+            self._write(version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return version
+
+    def _write(self, version):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(str(version))
+        os.replace(tmp, self.path)
+
+
+class RenderCache:
+    """LRU готовых ответов с ограничением по суммарному размеру тел.
+
+    build — идентичность сборки (шаблоны и статика). Она входит в ETag и в
+    проверку записи кэша наравне с версией контента: после выкладки с новыми
+    шаблонами или CSS/JS киоски получают новый HTML, а не 304 на старый.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, build=""):
+        self.max_bytes = max_bytes
+        self.build = build
+        self._entries = OrderedDict()   # key -> (version, body, mimetype)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, body, mimetype)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _drop(self, key):
+        _, body, _ = self._entries.pop(key)
+        self._size -= len(body)
+
+    def etag(self, key, version):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return f"v{version}-{self.build}-{digest}"
+
+    def cached(self, version_loader):
+        """Декоратор для view: ETag/304 и кэш тела ответа.
+
+        version_loader() возвращает текущую версию контента. Кэшируются
+        только ответы 200; 404 и пр. рендерятся каждый раз.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                version = version_loader()
+                key = request.full_path
+                etag = self.etag(key, version)
+                version = (self.build, version)  # запись кэша от прошлой сборки — промах
+                if request.if_none_match.contains(etag):
+                    resp = make_response("", 304)
+                    resp.set_etag(etag)
+                    resp.headers["Cache-Control"] = "no-cache"
+                    return resp
+
+                entry = self.get(key, version)
+                if entry is None:
+                    resp = make_response(view(*args, **kwargs))
+                    if resp.status_code != 200:
+                        return resp
+                    self.put(key, version, resp.get_data(), resp.mimetype)
+                else:
+                    resp = make_response(entry[1])
+                    resp.mimetype = entry[2]
+                resp.set_etag(etag)
+                resp.headers["Cache-Control"] = "no-cache"
+                return resp
+            return wrapper
+        return decorator
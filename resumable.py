@@ -0,0 +1,173 @@
+"""Загрузка больших файлов (PDF-брошюр) частями с докачкой.
+
+Клиент открывает сессию с именем и размером файла, шлёт части любого
+порядка и параллельно (PUT с сырым телом), а после обрыва спрашивает, какие
+части уже дошли, и досылает остальные. Части пишутся прямо в файл
+<uploads>/.tmp/<id>.part по своему смещению (pwrite), так что в памяти
+никогда не лежит больше одного блока. Завершение сессии хэширует собранный
+файл и переносит его в хранилище по содержимому (storage.py); к странице
+файл привязывает уже форма страницы, по id сессии.
+"""
+import os
+import secrets
+import time
+
+from storage import CHUNK_SIZE
+
+# Таблицы upload_sessions и upload_chunks создаёт миграция 8c4e2f7a1d35
+
+
+class UploadError(Exception):
+    """Ошибка запроса к сессии; status — HTTP-код ответа."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ResumableUploads:
+    """Сессии загрузки частями поверх UploadStore.
+
+    Состояние сессий хранится в БД (общей для всех воркеров), части — в
+    одном файле на сессию. conn — соединение вызывающего: create() и
+    write_chunk() коммитят сами, остальное коммитит вызывающий.
+    """
+
+    def __init__(self, store, max_file_bytes, chunk_bytes):
+        self.store = store
+        self.max_file_bytes = max_file_bytes
+        self.chunk_bytes = chunk_bytes
+
+    def part_path(self, upload_id):
+        return self.store.tmp_dir / f"{upload_id}.part"
+
+    def create(self, conn, filename, size):
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("размер файла не указан")
+        if size > self.max_file_bytes:
+            raise UploadError(f"файл больше {self.max_file_bytes // (1024 * 1024)} МБ", 413)
+        upload_id = secrets.token_hex(16)
+        self.store.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.part_path(upload_id), os.O_CREAT | os.O_WRONLY | os.O_EXCL, 0o600)
+        try:
+            os.ftruncate(fd, size)  # разреженный файл нужного размера: части пишутся по смещениям
+        finally:
+            os.close(fd)
+        conn.execute(
+            "INSERT INTO upload_sessions(id, filename, size, chunk_size, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (upload_id, filename, size, self.chunk_bytes, time.time()),
+        )
+        conn.commit()
+        return self.status(conn, upload_id)
+
+    def _session(self, conn, upload_id):
+        row = conn.execute("SELECT * FROM upload_sessions WHERE id=?", (upload_id,)).fetchone()
+        if row is None:
+            raise UploadError("сессия загрузки не найдена", 404)
+        return row
+
+    def status(self, conn, upload_id):
+        row = self._session(conn, upload_id)
+        received = [r[0] for r in conn.execute(
+            "SELECT idx FROM upload_chunks WHERE session_id=? ORDER BY idx", (upload_id,))]
+        return {
+            "id": row["id"],
+            "filename": row["filename"],
+            "size": row["size"],
+            "chunk_size": row["chunk_size"],
+            "chunks": -(-row["size"] // row["chunk_size"]),
+            "received": received,
+            "done": row["state"] == "done",
+        }
+
+    def write_chunk(self, conn, upload_id, index, stream, length):
+        """Записать часть index из потока; возвращает число принятых частей."""
+        row = self._session(conn, upload_id)
+        if row["state"] != "open":
+            raise UploadError("загрузка уже завершена", 409)
+        offset = index * row["chunk_size"]
+        expected = min(row["chunk_size"], row["size"] - offset)
+        if index < 0 or expected <= 0:
+            raise UploadError("номер части вне файла")
+        if length != expected:
+            raise UploadError(f"часть {index} должна быть {expected} байт", 400)
+
+        written = 0
+        fd = os.open(self.part_path(upload_id), os.O_WRONLY)
+        try:
+            while written < expected:
+                data = stream.read(min(CHUNK_SIZE, expected - written))
+                if not data:
+                    break
+                os.pwrite(fd, data, offset + written)
+                written += len(data)
+        finally:
+            os.close(fd)
+        if written != expected:
+            raise UploadError(f"часть {index} пришла не полностью", 400)
+
+        conn.execute("INSERT OR IGNORE INTO upload_chunks(session_id, idx) VALUES (?, ?)", (upload_id, index))
+        conn.execute("UPDATE upload_sessions SET updated_at=? WHERE id=?", (time.time(), upload_id))
+        conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM upload_chunks WHERE session_id=?", (upload_id,)).fetchone()[0]
+
+    def complete(self, conn, upload_id):
+        """Все части на месте -> файл в хранилище. Возвращает
+        (relpath, sha256, size, created) или None, если сессия уже была
+        завершена раньше (повтор запроса после обрыва). Отметку о
+        завершении коммитит вызывающий — вместе со ссылкой на файл."""
+        status = self.status(conn, upload_id)
+        if status["done"]:
+            return None
+        if len(status["received"]) != status["chunks"]:
+            raise UploadError(f"получено {len(status['received'])} частей из {status['chunks']}", 409)
+        # Захватить сессию, чтобы параллельный complete (в т.ч. из другого воркера) не собирал её второй раз
+        claimed = conn.execute(
+            "UPDATE upload_sessions SET state='assembling', updated_at=? WHERE id=? AND state='open'",
+            (time.time(), upload_id),
+        ).rowcount
+        conn.commit()
+        if not claimed:
+            raise UploadError("загрузка уже собирается", 409)
+        ext = status["filename"].rsplit(".", 1)[-1].lower()
+        try:
+            result = self.store.save_file(self.part_path(upload_id), ext)
+        except BaseException:
+            conn.execute("UPDATE upload_sessions SET state='open' WHERE id=?", (upload_id,))
+            conn.commit()
+            raise
+        conn.execute("UPDATE upload_sessions SET state='done', file_path=? WHERE id=?", (result[0], upload_id))
+        conn.execute("DELETE FROM upload_chunks WHERE session_id=?", (upload_id,))
+        return result
+
+    def take(self, conn, upload_id):
+        """Забрать завершённую загрузку для привязки к странице: (file_path, filename)
+        или None. Сессия удаляется в транзакции вызывающего."""
+        row = conn.execute(
+            "SELECT file_path, filename FROM upload_sessions WHERE id=? AND state='done'", (upload_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM upload_sessions WHERE id=?", (upload_id,))
+        return row["file_path"], row["filename"]
+
+    def discard(self, conn, upload_id):
+        """Удалить сессию; вернуть file_path, если файл уже лёг в хранилище
+        (вызывающий снимает с него ссылку)."""
+        row = self._session(conn, upload_id)
+        conn.execute("DELETE FROM upload_chunks WHERE session_id=?", (upload_id,))
+        conn.execute("DELETE FROM upload_sessions WHERE id=?", (upload_id,))
+        try:
+            os.remove(self.part_path(upload_id))
+        except FileNotFoundError:
+            pass
+        return row["file_path"]
+
+    def expire(self, conn, ttl):
+        """Удалить сессии без активности дольше ttl секунд; вернуть
+        file_path завершённых, но так и не привязанных загрузок."""
+        stale = conn.execute(
+            "SELECT id FROM upload_sessions WHERE updated_at < ?", (time.time() - ttl,)
+        ).fetchall()
+        paths = [self.discard(conn, row["id"]) for row in stale]
+        return [path for path in paths if path]
@@ -0,0 +1,152 @@
+"""Полнотекстовый поиск по страницам (SQLite FTS5).
+
+Индекс pages_fts хранит заголовок страницы, текст её HTML-контента без тегов
+и названия прикреплённых PDF; rowid строки индекса = pages.id. Индекс
+обновляется из тех же маршрутов админки, что меняют страницы, в их же
+транзакции — отдельной фоновой переиндексации нет.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+
+# Таблицу pages_fts создаёт (и заполняет) миграция 3f1c0a9d2b7e
+
+# Вес совпадений в bm25: заголовок, текст, названия PDF
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+SHORT_PREFIX = 3
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class _TextExtractor(HTMLParser):
+    SKIP = {"script", "style"}
+    BLOCK = {"p", "div", "br", "li", "tr", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BLOCK:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    if not html:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return " ".join("".join(parser.parts).split())
+
+
+def index_page(conn, page_id):
+    """Переиндексировать страницу (или убрать её из индекса, если её нет)."""
+    conn.execute("DELETE FROM pages_fts WHERE rowid=?", (page_id,))
+    row = conn.execute("SELECT title, content FROM pages WHERE id=?", (page_id,)).fetchone()
+    if row is None:
+        return
+    pdfs = conn.execute("SELECT title FROM page_pdfs WHERE page_id=? ORDER BY id", (page_id,)).fetchall()
+    conn.execute(
+        "INSERT INTO pages_fts(rowid, title, body, pdfs) VALUES (?, ?, ?, ?)",
+        (page_id, row[0] or "", html_to_text(row[1]), " ".join(p[0] for p in pdfs)),
+    )
+
+
+def remove_page(conn, page_id):
+    conn.execute("DELETE FROM pages_fts WHERE rowid=?", (page_id,))
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM pages_fts")
+    pdfs = {}
+    for page_id, title in conn.execute("SELECT page_id, title FROM page_pdfs ORDER BY id"):
+        pdfs.setdefault(page_id, []).append(title)
+    conn.executemany(
+        "INSERT INTO pages_fts(rowid, title, body, pdfs) VALUES (?, ?, ?, ?)",
+        (
+            (page_id, title or "", html_to_text(content), " ".join(pdfs.get(page_id, ())))
+            for page_id, title, content in conn.execute("SELECT id, title, content FROM pages").fetchall()
+        ),
+    )
+
+
+def _tokens(text):
+    return _TOKEN_RE.findall(text.lower())[:8]
+
+
+def build_query(tokens):
+    """Строка MATCH для поиска по мере набора: каждое слово — префикс,
+    все слова обязательны. None, если слов нет.
+
+    Пока последнее слово короче SHORT_PREFIX, ищем только по заголовкам:
+    одна-две буквы совпадают почти со всеми страницами, и ранжирование
+    всего текста стоило бы десятки миллисекунд без пользы для посетителя.
+    """
+    if not tokens:
+        return None
+    terms = [f'"{token}"*' for token in tokens]
+    if len(tokens[-1]) < SHORT_PREFIX:
+        return " AND ".join(f"title : {term}" for term in terms)
+    return " ".join(terms)
+
+
+def title_match(text):
+    """Строка MATCH «все слова — префиксы в заголовке» (фильтр списка в админке)."""
+    tokens = _tokens(text)
+    if not tokens:
+        return None
+    return " AND ".join(f'title : "{token}"*' for token in tokens)
+
+
+def _snippet(text, tokens, before=5, after=9):
+    """Фрагмент текста вокруг первого совпадения с подсвеченными словами.
+    Считаем в Python только для выданных страниц — snippet() FTS5 в
+    запросе с сортировкой вычислялся бы для каждого совпадения."""
+    words = list(_TOKEN_RE.finditer(text))
+    hit = next((i for i, m in enumerate(words) if m.group().lower().startswith(tuple(tokens))), None)
+    if hit is None:
+        hit = 0
+        before = 0
+    first, last = max(0, hit - before), min(len(words), hit + after + 1)
+    if first >= last:
+        return ""
+    out = ["…"] if first > 0 else []
+    pos = words[first].start()
+    for m in words[first:last]:
+        out.append(escape(text[pos:m.start()]))
+        word = escape(m.group())
+        out.append(f"<mark>{word}</mark>" if m.group().lower().startswith(tuple(tokens)) else word)
+        pos = m.end()
+    if last < len(words):
+        out.append("…")
+    return "".join(out)
+
+
+def search(conn, text, limit=20):
+    """Список (id, title, snippet_html), лучшие совпадения первыми."""
+    tokens = _tokens(text)
+    query = build_query(tokens)
+    if query is None:
+        return []
+    ids = [row[0] for row in conn.execute(
+        f"""SELECT rowid FROM pages_fts WHERE pages_fts MATCH ?
+            ORDER BY bm25(pages_fts, {', '.join(map(str, RANK_WEIGHTS))}) LIMIT ?""",
+        (query, limit),
+    )]
+    if not ids:
+        return []
+    rows = {row[0]: row for row in conn.execute(
+        f"SELECT rowid, title, body FROM pages_fts WHERE rowid IN ({', '.join('?' * len(ids))})", ids
+    )}
+    return [(pid, rows[pid][1], _snippet(rows[pid][2], tokens)) for pid in ids]
@@ -6,3 +6,111 @@ function tickDateTime(){
 }
 setInterval(tickDateTime, 1000);
 tickDateTime();
+
+
+// Подписка на изменения контента через SSE (/events).
+// handlers: { kind: function(data) }; EventSource сам переподключается
+// и передаёт Last-Event-ID, так что пропущенные события догоняются.
+function subscribeChanges(handlers){
+  if(!window.EventSource) return null;
+  var es = new EventSource('/events');
+  Object.keys(handlers).forEach(function(kind){
+    es.addEventListener(kind, function(e){
+      var data = {};
+      try { data = JSON.parse(e.data || '{}'); } catch(err){}
+      handlers[kind](data);
+    });
+  });
+  return es;
+}
+
+function applyTheme(theme){
+  var t = theme || 'light';
+  document.body.classList.toggle('theme-dark', t === 'dark');
+  document.body.classList.toggle('theme-light', t === 'light');
+}
+
+// Офлайн-режим (service worker /sw.js, см. static/js/sw.js).
+// Сервер видит только периодическую проверку манифеста (обычно 304).
+var OFFLINE_SYNC_INTERVAL = 5 * 60 * 1000;
+
+function registerOffline(){
+  if(!('serviceWorker' in navigator)) return;
+  navigator.serviceWorker.register('/sw.js').catch(function(err){ console.error(err); });
+  setInterval(function(){
+    offlineSync().then(function(changed){ if(changed) location.reload(); });
+  }, OFFLINE_SYNC_INTERVAL);
+}
+
+// Попросить service worker докачать изменения; resolve(число обновлённых записей)
+function offlineSync(){
+  var sw = navigator.serviceWorker && navigator.serviceWorker.controller;
+  if(!sw) return Promise.resolve(0);
+  return new Promise(function(resolve){
+    var channel = new MessageChannel();
+    channel.port1.onmessage = function(e){ resolve(e.data && e.data.changed || 0); };
+    sw.postMessage({type: 'sync'}, [channel.port2]);
+  });
+}
+
+// Перезагрузка после правки в админке: сначала обновить офлайн-кэш,
+// иначе service worker отдаст из него прежнюю версию страницы
+function reloadFresh(url){
+  offlineSync().then(function(){
+    if(url) location.href = url; else location.reload();
+  });
+}
+
+// Статистика: события копятся в localStorage (переживают перезагрузку и
+// обрывы сети) и уходят на /analytics/events пачками — по таймеру и при
+// уходе со страницы через sendBeacon.
+var TRACK_KEY = 'kioskEvents';
+var TRACK_INTERVAL = 15 * 1000;
+var TRACK_BATCH = 500;
+var TRACK_MAX_QUEUE = 5000;
+
+// Имя киоска: ?kiosk=<имя> в адресе (запоминается) или случайный id
+function kioskId(){
+  var m = location.search.match(/[?&]kiosk=([^&]+)/);
+  var id = m ? decodeURIComponent(m[1]) : localStorage.getItem('kioskId');
+  if(!id) id = 'kiosk-' + Math.random().toString(36).slice(2, 10);
+  localStorage.setItem('kioskId', id);
+  return id;
+}
+
+function _trackQueue(){
+  try { return JSON.parse(localStorage.getItem(TRACK_KEY) || '[]'); } catch(e){ return []; }
+}
+
+function _saveTrackQueue(queue){
+  try { localStorage.setItem(TRACK_KEY, JSON.stringify(queue.slice(-TRACK_MAX_QUEUE))); } catch(e){}
+}
+
+function track(kind, target){
+  var queue = _trackQueue();
+  queue.push({kind: kind, target: target, ts: Date.now()});
+  _saveTrackQueue(queue);
+}
+
+var _trackInFlight = false;
+function flushTracking(useBeacon){
+  var batch = _trackQueue().slice(0, TRACK_BATCH);
+  if(!batch.length || _trackInFlight) return;
+  var body = JSON.stringify({kiosk: kioskId(), events: batch});
+  // из очереди убираем ровно отправленное: пока шёл запрос, могли добавиться новые
+  var drop = function(){ _saveTrackQueue(_trackQueue().slice(batch.length)); };
+  if(useBeacon && navigator.sendBeacon){
+    if(navigator.sendBeacon('/analytics/events', new Blob([body], {type: 'application/json'}))) drop();
+    return;
+  }
+  _trackInFlight = true;
+  fetch('/analytics/events', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: body, keepalive: true})
+    .then(function(r){ if(r.ok) drop(); })
+    .catch(function(){})
+    .then(function(){ _trackInFlight = false; });
+}
+
+function startTracking(){
+  setInterval(flushTracking, TRACK_INTERVAL);
+  window.addEventListener('pagehide', function(){ flushTracking(true); });
+}
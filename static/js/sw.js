@@ -0,0 +1,105 @@
+// Офлайн-режим киоска. Отдаётся как /sw.js (область — весь сайт).
+//
+// В Cache Storage лежит всё из /offline/manifest.json: /kiosk, страницы,
+// статика, картинки, PDF и QR. Такие URL отдаются из кэша без сети.
+// Синхронизация скачивает только записи, у которых сменился хэш, и удаляет
+// пропавшие; сам манифест запрашивается условно (ETag), так что проверка
+// без изменений — это один ответ 304.
+const CACHE = 'kiosk-offline-v1';
+const MANIFEST_URL = '/offline/manifest.json';
+const PARALLEL = 4;
+const MANIFEST_RETRIES = 12;  // пока сервер собирает манифест (503), ждём до ~минуты
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => {
+  event.waitUntil(self.clients.claim().then(() => sync()));
+});
+
+self.addEventListener('message', event => {
+  if (!event.data || event.data.type !== 'sync') return;
+  const port = event.ports[0];
+  event.waitUntil(sync().then(
+    changed => port && port.postMessage({ ok: true, changed }),
+    err => port && port.postMessage({ ok: false, error: String(err) })
+  ));
+});
+
+self.addEventListener('fetch', event => {
+  const req = event.request;
+  if (req.method !== 'GET') return;
+  const url = new URL(req.url);
+  if (url.origin !== self.location.origin || url.pathname === MANIFEST_URL) return;
+  event.respondWith(
+    caches.open(CACHE)
+      .then(cache => cache.match(url.pathname))
+      .then(hit => hit || fetch(req))
+  );
+});
+
+// Одна синхронизация за раз: повторные вызовы ждут текущую
+let running = null;
+function sync() {
+  if (!running) running = doSync().finally(() => { running = null; });
+  return running;
+}
+
+// Манифест новой версии сервер собирает в фоне и до того отвечает 503 с Retry-After
+async function fetchManifest() {
+  for (let attempt = 0; ; attempt++) {
+    const resp = await fetch(MANIFEST_URL, { cache: 'no-cache' });
+    if (resp.status === 503 && attempt < MANIFEST_RETRIES) {
+      const wait = Number(resp.headers.get('Retry-After')) || 5;
+      await new Promise(resolve => setTimeout(resolve, Math.min(wait, 30) * 1000));
+      continue;
+    }
+    if (!resp.ok) throw new Error('manifest: HTTP ' + resp.status);
+    return resp.json();
+  }
+}
+
+async function doSync() {
+  const cache = await caches.open(CACHE);
+  const manifest = await fetchManifest();
+
+  const prevResp = await cache.match(MANIFEST_URL);
+  const prev = prevResp ? await prevResp.json() : { version: null, entries: [] };
+  if (prev.version === manifest.version) return 0;
+
+  const known = new Map(prev.entries.map(e => [e.url, e.hash]));
+  const wanted = new Map(manifest.entries.map(e => [e.url, e.hash]));
+  const todo = manifest.entries.filter(e => known.get(e.url) !== e.hash);
+
+  // Что не скачалось, остаётся со старым хэшем и докачается при следующей синхронизации
+  const done = new Map();
+  let next = 0;
+  async function worker() {
+    while (next < todo.length) {
+      const entry = todo[next++];
+      try {
+        const r = await fetch(entry.url, { cache: 'no-cache' });
+        if (r.ok && r.status === 200) {
+          await cache.put(entry.url, r);
+          done.set(entry.url, entry.hash);
+        }
+      } catch (err) { /* сеть пропала — попробуем в следующий раз */ }
+    }
+  }
+  await Promise.all(Array.from({ length: PARALLEL }, worker));
+
+  for (const url of known.keys()) {
+    if (!wanted.has(url)) await cache.delete(url);
+  }
+  const complete = done.size === todo.length;
+  const stored = {
+    // неполная синхронизация не должна выглядеть завершённой для этой версии
+    version: complete ? manifest.version : prev.version,
+    entries: manifest.entries
+      .map(e => ({ url: e.url, hash: done.get(e.url) || (known.get(e.url) === e.hash ? e.hash : known.get(e.url)) }))
+      .filter(e => e.hash)
+  };
+  await cache.put(MANIFEST_URL, new Response(JSON.stringify(stored), {
+    headers: { 'Content-Type': 'application/json' }
+  }));
+  return done.size;
+}
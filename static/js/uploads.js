@@ -0,0 +1,106 @@
+// Загрузка больших файлов частями (см. resumable.py): несколько частей
+// параллельно, повтор при сбоях сети, докачка после обрыва или перезагрузки
+// страницы — id сессии запоминается в localStorage по имени, размеру и дате файла.
+const UPLOAD_PARALLEL = 3;
+const UPLOAD_RETRIES = 5;
+
+async function uploadRequest(url, options) {
+  const r = await fetch(url, options);
+  if (!r.ok) {
+    let message = 'HTTP ' + r.status;
+    try { message = (await r.json()).error || message; } catch (e) {}
+    const err = new Error(message);
+    err.fatal = r.status < 500;  // 4xx повторять бессмысленно
+    throw err;
+  }
+  return r.status === 204 ? null : r.json();
+}
+
+async function putChunk(session, file, index) {
+  const start = index * session.chunk_size;
+  const blob = file.slice(start, Math.min(start + session.chunk_size, file.size));
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await uploadRequest(`/admin/uploads/${session.id}/${index}`, {
+        method: 'PUT', headers: {'Content-Type': 'application/octet-stream'}, body: blob
+      });
+    } catch (err) {
+      if (err.fatal || attempt >= UPLOAD_RETRIES) throw err;
+    }
+    await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+  }
+}
+
+// Загрузить файл; вернуть id завершённой сессии. onProgress(доля 0..1)
+async function uploadResumable(file, onProgress) {
+  const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  let session = null;
+  if (localStorage.getItem(key)) {
+    session = await uploadRequest('/admin/uploads/' + localStorage.getItem(key)).catch(() => null);
+  }
+  if (!session) {
+    session = await uploadRequest('/admin/uploads', {
+      method: 'POST', headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({filename: file.name, size: file.size})
+    });
+    localStorage.setItem(key, session.id);
+  }
+
+  if (!session.done) {
+    const received = new Set(session.received);
+    const todo = [];
+    for (let i = 0; i < session.chunks; i++) if (!received.has(i)) todo.push(i);
+    let sent = received.size, next = 0;
+    onProgress && onProgress(sent / session.chunks);
+    const worker = async () => {
+      while (next < todo.length) {
+        await putChunk(session, file, todo[next++]);
+        onProgress && onProgress(++sent / session.chunks);
+      }
+    };
+    await Promise.all(Array.from({length: UPLOAD_PARALLEL}, worker));
+    session = await uploadRequest(`/admin/uploads/${session.id}/complete`, {method: 'POST'});
+  }
+  localStorage.removeItem(key);
+  return session.id;
+}
+
+// Форма страницы: перед отправкой файлы из pdfs[] загружаются частями, а
+// форма уходит уже без них — с id загрузок в pdf_uploads[] (по одному на блок PDF)
+function bindResumableForm(form, itemSelector) {
+  let sending = false;
+  form.addEventListener('submit', async e => {
+    if (e.defaultPrevented || sending) return;
+    e.preventDefault();
+    sending = true;
+    const submit = form.querySelector('[type="submit"]');
+    if (submit) submit.disabled = true;
+    try {
+      for (const item of form.querySelectorAll(itemSelector)) {
+        const input = item.querySelector('input[type="file"][name="pdfs[]"]');
+        let hidden = item.querySelector('input[name="pdf_uploads[]"]');
+        if (!hidden) {
+          hidden = Object.assign(document.createElement('input'), {type: 'hidden', name: 'pdf_uploads[]'});
+          item.appendChild(hidden);
+        }
+        const file = input && input.files[0];
+        if (!file || hidden.value) continue;
+        let progress = item.querySelector('.upload-progress');
+        if (!progress) {
+          progress = Object.assign(document.createElement('span'), {className: 'upload-progress'});
+          item.appendChild(progress);
+        }
+        hidden.value = await uploadResumable(file, share => {
+          progress.textContent = Math.round(share * 100) + '%';
+        });
+      }
+      form.querySelectorAll('input[type="file"][name="pdfs[]"]').forEach(input => input.removeAttribute('name'));
+      if (window.tinymce) tinymce.triggerSave();
+      form.submit();
+    } catch (err) {
+      alert('Не удалось загрузить PDF: ' + err.message + '. Отправьте форму ещё раз — загрузка продолжится.');
+      sending = false;
+      if (submit) submit.disabled = false;
+    }
+  });
+}
@@ -0,0 +1,85 @@
+"""Хранилище загрузок с адресацией по содержимому.
+
+Файл хэшируется (sha256) прямо во время записи на диск и кладётся под именем
+<первые 2 символа>/<sha256>.<ext>. Одинаковые файлы хранятся один раз, а URL
+однозначно определяет содержимое — такие ответы можно кэшировать навсегда.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+CHUNK_SIZE = 64 * 1024
+_CA_RE = re.compile(r"^(?:_d/)?[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+(?:-\d+\.[a-z0-9]+)?$")
+
+
+def is_content_addressed(relpath):
+    """Путь в хранилище (или производная копия такого файла) — неизменяемый."""
+    return bool(_CA_RE.match(relpath))
+
+
+class UploadStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.tmp_dir = self.root / ".tmp"
+
+    def path(self, relpath):
+        return self.root / relpath
+
+    def save_stream(self, stream, ext):
+        """Сохраняет поток. Возвращает (relpath, sha256, size, created);
+        created=False — такой файл уже был, новая копия не записывалась."""
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            return self._commit(tmp, digest.hexdigest(), ext, size)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def save_file(self, path, ext):
+        """Переносит готовый файл (например, собранный из частей в tmp_dir)
+        в хранилище; path после этого не существует. Возвращает то же, что save_stream."""
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE * 16)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+        return self._commit(path, digest.hexdigest(), ext, size)
+
+    def save_bytes(self, data, ext):
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        return self._commit(tmp, hashlib.sha256(data).hexdigest(), ext, len(data))
+
+    def _commit(self, tmp, sha, ext, size):
+        relpath = f"{sha[:2]}/{sha}.{ext.lower()}"
+        dst = self.root / relpath
+        if dst.exists():
+            os.remove(tmp)
+            # mtime = время последней загрузки: сборщик мусора (upload_gc.py) не
+            # удалит файл, который только что загрузили заново
+            os.utime(dst)
+            return relpath, sha, size, False
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(tmp, 0o644)  # mkstemp создаёт 0600, а отдавать файл может и фронт-прокси
+        os.replace(tmp, dst)
+        return relpath, sha, size, True
@@ -0,0 +1,229 @@
+"""Уборка загрузок, на которые больше ничего не ссылается.
+
+Счётчики upload_refs ведутся по ходу правок и со временем расходятся с
+реальностью: картинку из TinyMCE загрузили, а страницу так и не сохранили;
+HTML страницы переписали, а ссылки на прежние картинки никто не снял. Поэтому
+сборщик им не доверяет, а каждый прогон строит индекс ссылок заново — по
+столбцам с путями (pages, page_pdfs, buttons, organization), по HTML страниц
+и по собранным, но ещё не привязанным загрузкам частями — и по нему:
+
+  * приводит upload_refs к фактическому числу ссылок;
+  * помечает в upload_orphans файлы на диске, которых в индексе нет (с
+    временем первой пометки); файл, на который снова сослались, с пометки
+    снимается;
+  * удаляет файлы, помеченные раньше чем grace секунд назад и с тех пор не
+    менявшиеся: за это время редактор, в который только что вставили
+    картинку, успевает сохранить страницу.
+
+Обходятся каталог загрузок (кроме .tmp — там части незавершённых загрузок)
+и старый каталог иконок uploads/buttons, если он принадлежит экземпляру
+(см. UPLOAD_FOLDER в app.py). Производные копии (_d/) живут, пока есть их
+строка в image_derivatives, а строки удаляются вместе с оригиналом.
+Итог каждого прогона пишется в upload_gc_runs.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from archive import HTML_COLUMNS, UPLOAD_URL_RE
+from storage import is_content_addressed
+
+log = logging.getLogger(__name__)
+
+# Таблицы upload_orphans и upload_gc_runs создаёт миграция 5d2b8e6f0a14
+
+KEEP_RUNS = 100
+
+
+def reference_index(conn, ref_columns):
+    """Counter путей загрузок: столбцы ref_columns, картинки в HTML страниц
+    (раз на страницу — так же, как их считает archive.referenced_uploads)
+    и завершённые, но не привязанные к странице загрузки частями."""
+    refs = Counter()
+    for table, column in ref_columns:
+        for row in conn.execute(f"SELECT {column}, COUNT(*) FROM {table} "
+                                f"WHERE {column} IS NOT NULL AND {column} != '' GROUP BY {column}"):
+            refs[row[0]] += row[1]
+    for row in conn.execute(f"SELECT {', '.join(HTML_COLUMNS)} FROM pages"):
+        refs.update(set(UPLOAD_URL_RE.findall(" ".join(value or "" for value in row))))
+    for row in conn.execute("SELECT file_path FROM upload_sessions WHERE state='done' AND file_path IS NOT NULL"):
+        refs[row[0]] += 1
+    return refs
+
+
+class UploadGC:
+    """roots — [(каталог, подкаталоги для обхода или None — весь каталог)];
+    путь файла в индексе считается от своего каталога, как его пишут в БД
+    (например, старая иконка — buttons/<имя> от uploads/)."""
+
+    def __init__(self, upload_dir, roots, ref_columns, grace, interval):
+        self.upload_dir = Path(upload_dir)
+        self.roots = [(Path(root), subdirs) for root, subdirs in roots]
+        self.ref_columns = ref_columns
+        self.grace = grace
+        self.interval = interval
+        self._lock = threading.Lock()        # один прогон за раз в процессе
+        self._start_lock = threading.Lock()
+        self._worker = None
+
+    # ---------- Обход диска ----------
+    def _scan(self):
+        """{путь в индексе: (файл на диске, размер, mtime)}."""
+        found = {}
+        for root, subdirs in self.roots:
+            for top in ([root / d for d in subdirs] if subdirs else [root]):
+                for dirpath, dirnames, filenames in os.walk(top):
+                    if Path(dirpath) == self.upload_dir:
+                        dirnames[:] = [d for d in dirnames if d != ".tmp"]
+                    for name in filenames:
+                        path = Path(dirpath) / name
+                        try:
+                            st = path.stat()
+                        except FileNotFoundError:
+                            continue
+                        found.setdefault(path.relative_to(root).as_posix(), (path, st.st_size, st.st_mtime))
+        return found
+
+    # ---------- Прогон ----------
+    def run(self, conn_factory, grace=None, run_id=None):
+        """Один прогон; возвращает отчёт (он же пишется в upload_gc_runs)."""
+        grace = self.grace if grace is None else grace
+        with self._lock:
+            started = time.time()
+            files = self._scan()  # до транзакции: обход диска не держит блокировку БД
+            conn = conn_factory()
+            try:
+                if run_id is None:
+                    run_id = conn.execute("INSERT INTO upload_gc_runs(started_at) VALUES (?)", (started,)).lastrowid
+                    conn.commit()
+                try:
+                    report, doomed = self._collect(conn, files, grace)
+                    report["deleted_files"], report["deleted_bytes"] = self._delete(doomed, grace)
+                except Exception as e:
+                    conn.rollback()
+                    conn.execute("UPDATE upload_gc_runs SET finished_at=?, error=? WHERE id=?",
+                                 (time.time(), str(e) or e.__class__.__name__, run_id))
+                    conn.commit()
+                    raise
+                report["duration"] = round(time.time() - started, 3)
+                conn.execute(
+                    """UPDATE upload_gc_runs SET finished_at=?, deleted_files=?, deleted_bytes=?, pending_files=?,
+                       pending_bytes=?, fixed_refs=?, missing_files=? WHERE id=?""",
+                    (time.time(), report["deleted_files"], report["deleted_bytes"], report["pending_files"],
+                     report["pending_bytes"], report["fixed_refs"], report["missing_files"], run_id),
+                )
+                conn.execute("DELETE FROM upload_gc_runs WHERE id <= ?", (run_id - KEEP_RUNS,))
+                conn.commit()
+            finally:
+                conn.close()
+        log.info("уборка загрузок: удалено %d файлов (%d байт), ждут удаления %d",
+                 report["deleted_files"], report["deleted_bytes"], report["pending_files"])
+        return report
+
+    def _collect(self, conn, files, grace):
+        """Индекс ссылок, сверка счётчиков и пометки — одной транзакцией
+        записи, чтобы правка из админки не вклинилась между чтением ссылок и
+        решением об удалении. Возвращает (отчёт, [(файл, размер, mtime)])."""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        index = reference_index(conn, self.ref_columns)
+
+        # Счётчики по фактическим ссылкам; у неиспользуемых — 0 до удаления файла
+        fixed = []
+        counted = {row[0]: row[1] for row in conn.execute("SELECT path, refcount FROM upload_refs")}
+        for path, refcount in counted.items():
+            if refcount != index.get(path, 0):
+                fixed.append((index.get(path, 0), path))
+        conn.executemany("UPDATE upload_refs SET refcount=? WHERE path=?", fixed)
+        added = [
+            (path, path.rsplit("/", 1)[-1].split(".", 1)[0], files[path][1], n)
+            for path, n in index.items()
+            if path not in counted and is_content_addressed(path) and path in files
+        ]
+        conn.executemany("INSERT INTO upload_refs(path, sha256, size, refcount) VALUES (?, ?, ?, ?)", added)
+        missing = [path for path in index if path not in files]
+
+        derivatives = {row[0] for row in conn.execute("SELECT path FROM image_derivatives")}
+        orphans = {path: entry for path, entry in files.items() if path not in index and path not in derivatives}
+
+        marks = {row[0]: row[1] for row in conn.execute("SELECT path, seen_at FROM upload_orphans")}
+        conn.executemany("DELETE FROM upload_orphans WHERE path=?", [(p,) for p in marks if p not in orphans])
+        conn.executemany("INSERT INTO upload_orphans(path, size, seen_at) VALUES (?, ?, ?)",
+                         [(p, entry[1], now) for p, entry in orphans.items() if p not in marks])
+
+        cutoff = now - grace
+        expired = {p for p, (_, _, mtime) in orphans.items() if marks.get(p, now) <= cutoff and mtime <= cutoff}
+        doomed = [orphans[p] for p in expired]
+        # Вместе с оригиналом уходят его производные копии
+        for p in expired:
+            for row in conn.execute("SELECT path FROM image_derivatives WHERE source=?", (p,)):
+                if row[0] in files:
+                    doomed.append(files[row[0]])
+        conn.executemany("DELETE FROM image_derivatives WHERE source=?", [(p,) for p in expired])
+        conn.executemany("DELETE FROM upload_refs WHERE path=?", [(p,) for p in expired])
+        conn.executemany("DELETE FROM upload_orphans WHERE path=?", [(p,) for p in expired])
+        conn.commit()
+
+        pending = [entry for p, entry in orphans.items() if p not in expired]
+        return {
+            "referenced": len(index),
+            "fixed_refs": len(fixed) + len(added),
+            "missing_files": len(missing),
+            "pending_files": len(pending),
+            "pending_bytes": sum(size for _, size, _ in pending),
+        }, doomed
+
+    def _delete(self, doomed, grace):
+        deleted, reclaimed = 0, 0
+        cutoff = time.time() - grace
+        for path, size, _ in doomed:
+            try:
+                # Файл успели загрузить заново (save_* обновляет mtime) — оставить
+                if path.stat().st_mtime > cutoff:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            deleted += 1
+            reclaimed += size
+        return deleted, reclaimed
+
+    # ---------- Фоновый запуск ----------
+    def ensure_running(self, conn_factory):
+        """Запустить фоновый поток (один на процесс). Прогоны раз в interval
+        секунд; какой из воркеров его сделает — решает claim() через БД."""
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, args=(conn_factory,), daemon=True,
+                                                    name="upload-gc")
+                    self._worker.start()
+
+    def claim(self, conn):
+        """id нового прогона, если прошлый был раньше interval секунд назад; иначе None."""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        last = conn.execute("SELECT MAX(started_at) FROM upload_gc_runs").fetchone()[0]
+        if last is not None and last > now - self.interval:
+            conn.rollback()
+            return None
+        run_id = conn.execute("INSERT INTO upload_gc_runs(started_at) VALUES (?)", (now,)).lastrowid
+        conn.commit()
+        return run_id
+
+    def _run(self, conn_factory):
+        while True:
+            try:
+                conn = conn_factory()
+                try:
+                    run_id = self.claim(conn)
+                finally:
+                    conn.close()
+                if run_id is not None:
+                    self.run(conn_factory, run_id=run_id)
+            except Exception:
+                log.exception("фоновая уборка загрузок не удалась")
+            time.sleep(min(self.interval, 600))
@@ -0,0 +1,9 @@
+"""Точка входа WSGI и CLI.
+
+    gunicorn -c gunicorn.conf.py wsgi:app      # продакшен, см. gunicorn.conf.py
+    flask --app wsgi db upgrade                # схема БД (каталог migrations/)
+    flask --app wsgi build-assets              # и остальные команды приложения
+"""
+from app import create_app
+
+app = create_app()